@@ -0,0 +1,131 @@
+import hashlib
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+
+from backend.models import ProductLove, BoardProduct, BrandStat
+
+MEMBERSHIP_TIMEOUT = 60 * 60 * 24
+FEED_TIMEOUT = 60 * 60
+BRAND_TIMEOUT = 60 * 60 * 24
+
+
+def brand_key(prefix, brand_name):
+    # Brand names may contain spaces, which memcached keys can't.
+    return "{0}_{1}".format(prefix, hashlib.md5(brand_name.encode()).hexdigest())
+
+
+def brand_followers_key(brand_name):
+    return brand_key('brand_followers', brand_name)
+
+
+def brand_info_key(brand_name):
+    return brand_key('brand_info', brand_name)
+
+
+def get_brand_followers(brand_name):
+    """Follower count of the brand, read from ``BrandStat`` on a cache miss."""
+    key = brand_followers_key(brand_name)
+    followers = cache.get(key)
+    if followers is None:
+        followers = BrandStat.objects.filter(brand_name=brand_name).values_list('followers_count', flat=True).first() or 0
+        cache.set(key, followers, BRAND_TIMEOUT)
+    return followers
+
+
+def get_brand_info(brand_name):
+    """Number of genders and the display name of a brand, from its sites."""
+    key = brand_info_key(brand_name)
+    info = cache.get(key)
+    if info is None:
+        sql = """
+            select count(*) genders from (select gender from sites where name = %s group by gender) g
+            """
+        sql2 = "select display_name from sites where name = %s"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [brand_name])
+            row = cursor.fetchone()
+            cursor.execute(sql2, [brand_name])
+            row2 = cursor.fetchone()
+        info = {
+            'genders': row[0],
+            'display_name': row2[0] if row2 else None,
+        }
+        cache.set(key, info, BRAND_TIMEOUT)
+    return info
+
+
+def liked_products_key(user_id):
+    return "liked_products_{0}".format(user_id)
+
+
+def saved_products_key(user_id):
+    return "saved_products_{0}".format(user_id)
+
+
+def get_liked_product_ids(user_id):
+    """Ids of the products the user loves, cached until a ProductLove of the user changes."""
+    key = liked_products_key(user_id)
+    product_ids = cache.get(key)
+    if product_ids is None:
+        product_ids = set(ProductLove.objects.filter(user_id=user_id).values_list('product_id', flat=True))
+        cache.set(key, product_ids, MEMBERSHIP_TIMEOUT)
+    return product_ids
+
+
+def get_saved_product_ids(user_id):
+    """Ids of the products the user saved to any of their boards, cached until one of them changes."""
+    key = saved_products_key(user_id)
+    product_ids = cache.get(key)
+    if product_ids is None:
+        product_ids = set(BoardProduct.objects.filter(user_id=user_id).values_list('product_id', flat=True))
+        cache.set(key, product_ids, MEMBERSHIP_TIMEOUT)
+    return product_ids
+
+
+def flag_products(product_list, user_id):
+    """Overlay the user's liked/saved flags on a user-independent product list."""
+    liked_ids = get_liked_product_ids(user_id)
+    saved_ids = get_saved_product_ids(user_id)
+    return [dict(product, liked=product['id'] in liked_ids, saved=product['id'] in saved_ids)
+            for product in product_list]
+
+
+def cache_is_shared():
+    """Whether other processes, like the scrapyd crawls calling ``expire_feeds()``, see this cache."""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def feed_generation():
+    generation = cache.get('feed_generation')
+    if generation is None:
+        cache.add('feed_generation', 1, None)
+        generation = cache.get('feed_generation', 1)
+    return generation
+
+
+def expire_feeds():
+    """Drop every cached feed page, e.g. once a crawl has written new products."""
+    try:
+        cache.incr('feed_generation')
+    except ValueError:
+        cache.set('feed_generation', 1, None)
+
+
+def get_feed_page(key_parts, build):
+    """Feed page shared by all users, built with ``build()`` on a miss.
+
+    Pages live until ``FEED_TIMEOUT`` or until the next ``expire_feeds()``,
+    whichever comes first.  A per-process cache never sees the crawls'
+    ``expire_feeds()``, so there every page is built fresh.
+    """
+    if not cache_is_shared():
+        return build()
+    digest = hashlib.md5(':'.join(str(part) for part in key_parts).encode()).hexdigest()
+    key = "feed_{0}_{1}".format(feed_generation(), digest)
+    page = cache.get(key)
+    if page is None:
+        page = build()
+        cache.set(key, page, FEED_TIMEOUT)
+    return page
@@ -0,0 +1,37 @@
+import logging
+import os
+import threading
+from concurrent import futures
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-cleanup')
+        return _executor
+
+
+def remove_image_files(filenames):
+    """Delete stored product images from ``IMAGES_ROOT`` in a background thread."""
+    filenames = [filename for filename in filenames if filename]
+    if filenames:
+        executor().submit(remove_files, filenames)
+
+
+def remove_files(filenames):
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(settings.IMAGES_ROOT, filename))
+            logger.info('The product image deleted.')
+        except FileNotFoundError:
+            logger.warning('The product image does not exist.')
+        except OSError:
+            logger.exception('Could not delete the product image {}'.format(filename))
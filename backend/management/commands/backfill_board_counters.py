@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from backend.models import Board, BoardFollower, BoardProduct
+
+
+class Command(BaseCommand):
+    help = "Recount board followers and today's new products into the board counter columns"
+
+    def handle(self, *args, **kwargs):
+        today = timezone.now().date()
+        followers = BoardFollower.objects.filter(board=OuterRef('pk')).order_by() \
+            .values('board').annotate(count=Count('id')).values('count')
+        newest = BoardProduct.objects.filter(board=OuterRef('pk'), created_at__date=today).order_by() \
+            .values('board').annotate(count=Count('id')).values('count')
+        count = Board.objects.update(
+            followers_count=Coalesce(Subquery(followers), Value(0)),
+            new_products_count=Coalesce(Subquery(newest), Value(0)),
+            new_products_date=today,
+        )
+        print("{0} boards updated.".format(count))
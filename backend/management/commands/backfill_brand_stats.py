@@ -0,0 +1,19 @@
+from django.core.cache import cache
+from django.core.management import BaseCommand
+from django.db.models import Count
+
+from backend.caches import brand_followers_key
+from backend.models import BrandFollower, BrandStat
+
+
+class Command(BaseCommand):
+    help = "Recount brand followers into the brand_stats counters"
+
+    def handle(self, *args, **kwargs):
+        counts = BrandFollower.objects.values('brand_name').annotate(followers=Count('id')).order_by()
+        for row in counts:
+            BrandStat.objects.update_or_create(brand_name=row['brand_name'],
+                                               defaults={'followers_count': row['followers']})
+            cache.delete(brand_followers_key(row['brand_name']))
+        BrandStat.objects.exclude(brand_name__in=[row['brand_name'] for row in counts]).update(followers_count=0)
+        print("{0} brands updated.".format(len(counts)))
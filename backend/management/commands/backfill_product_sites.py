@@ -0,0 +1,12 @@
+from django.core.management import BaseCommand
+
+from backend.models import Site, Product
+
+
+class Command(BaseCommand):
+    help = "Copy site name, display name, gender and type onto existing products"
+
+    def handle(self, *args, **kwargs):
+        for site in Site.objects.all():
+            count = Product.objects.filter(site=site).update(**site.product_fields())
+            print("{0}: {1} products updated.".format(site, count))
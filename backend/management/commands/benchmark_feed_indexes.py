@@ -0,0 +1,144 @@
+import time
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from backend.models import FIRST_CHECK_AGE, SHUFFLE_KEY_RANGE
+
+FEED_QUERIES = [
+    (
+        'explore feed, today, newest first',
+        """
+        select p.id from products p
+        where p.site_type = 1 and p.site_gender = 1 and p.inserted_at >= now() - interval '1 day'
+        order by p.inserted_at desc, p.id desc limit 60
+        """,
+    ),
+    (
+        'explore feed, shuffled',
+        """
+        select p.id from products p
+        where p.site_type = 1 and p.shuffle_key >= 1073741823
+        order by p.shuffle_key, p.id limit 60
+        """,
+    ),
+    (
+        'brand feed, this week',
+        """
+        select p.id from products p
+        where p.site_type = 1 and p.site_name = 'Bench0' and p.inserted_at >= now() - interval '7 days'
+        order by p.inserted_at desc, p.id desc limit 60
+        """,
+    ),
+    (
+        'followed brands feed',
+        """
+        select p.id from products p
+        where p.site_name in (select brand_name from brand_followers where user_id = {user_id})
+          and p.site_type = 1
+        order by p.inserted_at desc, p.id desc limit 60
+        """,
+    ),
+    (
+        'liked product ids',
+        "select product_id from product_love where user_id = {user_id}",
+    ),
+    (
+        'brand follower count',
+        "select count(*) from brand_followers where brand_name = 'Bench0'",
+    ),
+    (
+        'unavailable products',
+        "select id from products where status <> 200",
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = "Seed a throwaway dataset and compare feed query plans with and without the feed indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000000, help='number of products to seed')
+        parser.add_argument('--brands', type=int, default=40, help='number of brands to seed')
+
+    def handle(self, *args, **kwargs):
+        # Everything happens in one transaction that is rolled back at the end, the dropped indexes included.
+        with transaction.atomic():
+            user_id = self.seed(kwargs['products'], kwargs['brands'])
+            queries = [(title, sql.format(user_id=user_id)) for title, sql in FEED_QUERIES]
+            with connection.cursor() as cursor:
+                with_indexes = [self.explain(cursor, sql) for title, sql in queries]
+                for name in self.feed_indexes():
+                    cursor.execute("drop index {0}".format(connection.ops.quote_name(name)))
+                without_indexes = [self.explain(cursor, sql) for title, sql in queries]
+            for (title, sql), without_plan, with_plan in zip(queries, without_indexes, with_indexes):
+                self.stdout.write("=== {0}".format(title))
+                self.write_plan('without the feed indexes', without_plan)
+                self.write_plan('with the feed indexes', with_plan)
+            transaction.set_rollback(True)
+
+    def feed_indexes(self):
+        """Names of the indexes declared in the backend models' Meta; the primary, foreign and unique keys stay."""
+        return [index.name for model in apps.get_app_config('backend').get_models() for index in model._meta.indexes]
+
+    def seed(self, product_count, brand_count):
+        started = time.monotonic()
+        user = User.objects.create_user('benchmark.feed.indexes')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                insert into sites (name, display_name, scrape_url, short_url, gender, type, inserted_at, updated_at)
+                select 'Bench' || (g / 4), 'Bench ' || (g / 4), 'https://example.com', 'example',
+                       g %% 2 + 1, (g / 2) %% 2 + 1, now(), now()
+                from generate_series(0, %s - 1) g
+                returning id
+                """,
+                [brand_count * 4])
+            site_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                """
+                insert into products (title, price, product_link, status, shuffle_key, site_id, inserted_at, updated_at,
+                                      next_check_at, check_priority)
+                select 'Product ' || g, '10.00', 'https://example.com/bench/' || g,
+                       case when g %% 50 = 0 then 404 else 200 end,
+                       floor(random() * %s), (%s::int[])[1 + g %% %s],
+                       now() - (g %% 365) * interval '1 day' - random() * interval '1 day', now(),
+                       now() + %s, 0
+                from generate_series(1, %s) g
+                """,
+                [SHUFFLE_KEY_RANGE, site_ids, len(site_ids), FIRST_CHECK_AGE, product_count])
+            cursor.execute(
+                """
+                update products p
+                set site_name = s.name, site_display_name = s.display_name, site_gender = s.gender, site_type = s.type
+                from sites s
+                where s.id = p.site_id and s.id = any(%s)
+                """,
+                [site_ids])
+            cursor.execute(
+                """
+                insert into brand_followers (brand_name, user_id)
+                select 'Bench' || g, %s from generate_series(0, %s - 1, 2) g
+                """,
+                [user.id, brand_count])
+            cursor.execute(
+                """
+                insert into product_love (product_id, user_id)
+                select id, %s from products where product_link like 'https://example.com/bench/%%' limit 1000
+                """,
+                [user.id])
+            for table in ['sites', 'products', 'brand_followers', 'product_love']:
+                cursor.execute("analyze {0}".format(table))
+        self.stdout.write("Seeded {0} products in {1:.1f}s".format(product_count, time.monotonic() - started))
+        return user.id
+
+    def explain(self, cursor, sql):
+        cursor.execute("explain (analyze, costs off) " + sql)
+        return [row[0] for row in cursor.fetchall()]
+
+    def write_plan(self, label, plan):
+        self.stdout.write("--- {0}".format(label))
+        for line in plan:
+            self.stdout.write("    " + line)
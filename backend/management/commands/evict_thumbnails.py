@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from backend.thumbnails import evict_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Trim the thumbnail cache to THUMBNAIL_CACHE_SIZE, least recently used first"
+
+    def handle(self, *args, **kwargs):
+        removed = evict_thumbnails()
+        print("{0} thumbnails removed.".format(removed))
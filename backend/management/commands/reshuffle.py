@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+from django.db import connection
+
+from backend.caches import expire_feeds
+from backend.models import SHUFFLE_KEY_RANGE
+
+
+class Command(BaseCommand):
+    help = "Draw new shuffle keys for products and boards; run nightly by reshuffle.timer, see the README"
+
+    def handle(self, *args, **kwargs):
+        with connection.cursor() as cursor:
+            for table in ['products', 'boards']:
+                cursor.execute(
+                    "update {0} set shuffle_key = floor(random() * %s)".format(table),
+                    [SHUFFLE_KEY_RANGE])
+                print("{0}: {1} rows reshuffled.".format(table, cursor.rowcount))
+        # Cached shuffled pages were cut from the old order.
+        expire_feeds()
@@ -1,13 +1,48 @@
-import logging
-import os
+import hashlib
+import json
+import random
+from datetime import timedelta
 
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import JSONField
-from django.db.models.signals import post_delete
+from django.db import models, transaction
+from django.db.models import Case, F, JSONField, Q, Value, When
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 
+SHUFFLE_KEY_RANGE = 2 ** 31 - 1
+# Products are first checked this long after they were scraped.
+FIRST_CHECK_AGE = timedelta(days=30)
+# Days until the next check, indexed by check_priority.
+CHECK_INTERVALS = [14, 7, 4, 2, 1]
+
+
+def random_shuffle_key():
+    return random.randrange(SHUFFLE_KEY_RANGE)
+
+
+def first_check_at():
+    return timezone.now() + FIRST_CHECK_AGE
+
+
+def check_priority(age, popularity, status):
+    """How urgently a checked product should be checked again, from 0 to 4.
+
+    Products the checker couldn't read are retried first, then the ones
+    users loved or saved to boards, then the ones older than 90 days, which
+    are the likeliest to be gone.
+    """
+    if status != 200:
+        return 4
+    if popularity >= 10:
+        return 3
+    if popularity > 0:
+        return 2
+    if age > timedelta(days=90):
+        return 1
+    return 0
+
 
 class UserProfile(models.Model):
     GENDERS = [
@@ -45,10 +80,23 @@ class Site(models.Model):
     class Meta:
         db_table = 'sites'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'gender', 'type'], name='sites_name_gender_type_idx'),
+            models.Index(fields=['type', 'gender'], name='sites_type_gender_idx'),
+        ]
 
     def __str__(self):
         return '{0} - {1} - {2}'.format(self.display_name, self.get_gender_display(), self.get_type_display())
 
+    def product_fields(self):
+        """Site attributes copied onto its products so the feeds can filter without joining sites."""
+        return {
+            'site_name': self.name,
+            'site_display_name': self.display_name,
+            'site_gender': self.gender,
+            'site_type': self.type,
+        }
+
 
 class Product(models.Model):
     title = models.CharField(max_length=255)
@@ -58,8 +106,20 @@ class Product(models.Model):
     product_link = models.URLField(unique=True)
     hq_image_filename = models.CharField(max_length=255, null=True, blank=True)
     status = models.IntegerField(default=200)
+    shuffle_key = models.IntegerField(default=random_shuffle_key)
+    # See compute_content_hash; lets the scraper skip rows that didn't change.
+    content_hash = models.CharField(max_length=32, null=True, blank=True)
+    # Checkers only visit products whose next_check_at has passed, most urgent check_priority first.
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    next_check_at = models.DateTimeField(default=first_check_at)
+    check_priority = models.IntegerField(default=0)
 
     site = models.ForeignKey(Site, on_delete=models.CASCADE)
+    # Copies of the site's attributes, see Site.product_fields.
+    site_name = models.CharField(max_length=255, null=True, blank=True)
+    site_display_name = models.CharField(max_length=255, null=True, blank=True)
+    site_gender = models.IntegerField(choices=Site.GENDERS, null=True)
+    site_type = models.IntegerField(choices=Site.TYPES, null=True)
 
     inserted_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -67,10 +127,29 @@ class Product(models.Model):
     class Meta:
         db_table = 'products'
         ordering = ['-inserted_at']
+        indexes = [
+            models.Index(fields=['site_type', '-inserted_at', '-id'], name='products_type_inserted_idx'),
+            models.Index(fields=['site_type', 'site_gender', '-inserted_at', '-id'],
+                         name='products_type_gender_ins_idx'),
+            models.Index(fields=['site_type', 'shuffle_key', 'id'], name='products_type_shuffle_idx'),
+            models.Index(fields=['site_type', 'site_gender', 'shuffle_key', 'id'],
+                         name='products_type_gender_shuf_idx'),
+            models.Index(fields=['site_name', 'site_type', '-inserted_at'], name='products_brand_inserted_idx'),
+            models.Index(fields=['-inserted_at', '-id'], name='products_inserted_idx'),
+            models.Index(fields=['status'], name='products_unavailable_idx', condition=~Q(status=200)),
+            models.Index(fields=['next_check_at'], name='products_next_check_idx'),
+            # The checkers' queue order, see CheckerSpider.products.
+            models.Index(fields=['-check_priority', 'next_check_at'], name='products_check_queue_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def compute_content_hash(self):
+        """Digest of the fields a re-scrape can change."""
+        content = json.dumps([self.price, self.sale_price, self.image_filename, self.hq_image_filename, self.site_id])
+        return hashlib.md5(content.encode()).hexdigest()
+
     @property
     def image_preview(self):
         if self.image_filename:
@@ -79,24 +158,28 @@ class Product(models.Model):
             return ""
 
 
-@receiver(post_delete, sender=Product)
-def submission_delete(sender, instance, **kwargs):
-    logger = logging.getLogger(__name__)
+@receiver(post_save, sender=Site)
+def site_save(sender, instance, created, **kwargs):
+    from backend.caches import brand_info_key
+    from django.core.cache import cache
+    if not created:
+        Product.objects.filter(site=instance).update(**instance.product_fields())
+    cache.delete(brand_info_key(instance.name))
+
 
-    base_path = "/home/deploy/images"
-    image_path = "{}/{}".format(base_path, instance.image_filename)
-    hq_image_path = "{}/{}".format(base_path, instance.hq_image_filename)
-    if os.path.exists(image_path):
-        logger.info('The product image deleted.')
-        os.remove(image_path)
-    else:
-        logger.warning('The product image does not exist.')
+@receiver(post_delete, sender=Site)
+def site_delete(sender, instance, **kwargs):
+    from backend.caches import brand_info_key
+    from django.core.cache import cache
+    cache.delete(brand_info_key(instance.name))
 
-    if os.path.exists(hq_image_path):
-        logger.info('The product hq image deleted.')
-        os.remove(hq_image_path)
-    else:
-        logger.warning('The product hq image does not exist.')
+
+@receiver(post_delete, sender=Product)
+def submission_delete(sender, instance, **kwargs):
+    from backend.images import remove_image_files
+    # Files go once the delete is committed, off the request or crawl that deleted the rows.
+    filenames = [instance.image_filename, instance.hq_image_filename]
+    transaction.on_commit(lambda: remove_image_files(filenames))
 
 
 class BrandFollower(models.Model):
@@ -105,6 +188,41 @@ class BrandFollower(models.Model):
 
     class Meta:
         db_table = 'brand_followers'
+        indexes = [
+            models.Index(fields=['brand_name', 'user'], name='brand_followers_brand_idx'),
+            models.Index(fields=['user', 'brand_name'], name='brand_followers_user_idx'),
+        ]
+
+
+class BrandStat(models.Model):
+    brand_name = models.CharField(max_length=255, unique=True)
+    followers_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'brand_stats'
+
+    def __str__(self):
+        return self.brand_name
+
+
+def change_brand_followers(brand_name, delta):
+    """Move the brand's follower counter in the caller's transaction and drop the cached count once it commits."""
+    from backend.caches import brand_followers_key
+    from django.core.cache import cache
+    stat, created = BrandStat.objects.get_or_create(brand_name=brand_name)
+    BrandStat.objects.filter(pk=stat.pk).update(followers_count=F('followers_count') + delta)
+    transaction.on_commit(lambda: cache.delete(brand_followers_key(brand_name)))
+
+
+@receiver(post_save, sender=BrandFollower)
+def brand_follower_save(sender, instance, created, **kwargs):
+    if created:
+        change_brand_followers(instance.brand_name, 1)
+
+
+@receiver(post_delete, sender=BrandFollower)
+def brand_follower_delete(sender, instance, **kwargs):
+    change_brand_followers(instance.brand_name, -1)
 
 
 class ProductLove(models.Model):
@@ -113,6 +231,25 @@ class ProductLove(models.Model):
 
     class Meta:
         db_table = 'product_love'
+        indexes = [
+            models.Index(fields=['user', 'product'], name='product_love_user_product_idx'),
+        ]
+
+
+@receiver(post_save, sender=ProductLove)
+def product_love_save(sender, instance, created, **kwargs):
+    from backend.caches import liked_products_key
+    from django.core.cache import cache
+    key = liked_products_key(instance.user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(post_delete, sender=ProductLove)
+def product_love_delete(sender, instance, **kwargs):
+    from backend.caches import liked_products_key
+    from django.core.cache import cache
+    key = liked_products_key(instance.user_id)
+    transaction.on_commit(lambda: cache.delete(key))
 
 
 class Board(models.Model):
@@ -125,6 +262,10 @@ class Board(models.Model):
     type = models.IntegerField(choices=BOARD_TYPES)
     image_filename = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
+    shuffle_key = models.IntegerField(default=random_shuffle_key)
+    followers_count = models.IntegerField(default=0)
+    new_products_count = models.IntegerField(default=0)
+    new_products_date = models.DateField(null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
     created_at = models.DateTimeField(auto_now_add=True, null=True)
@@ -133,10 +274,18 @@ class Board(models.Model):
     class Meta:
         db_table = 'boards'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['shuffle_key', 'id'], name='boards_public_shuffle_idx', condition=Q(type=1)),
+        ]
 
     def __str__(self):
         return self.name
 
+    def new_products_today(self):
+        if self.new_products_date == timezone.now().date():
+            return self.new_products_count
+        return 0
+
     @property
     def image_preview(self):
         if self.image_filename:
@@ -155,6 +304,38 @@ class BoardProduct(models.Model):
     class Meta:
         db_table = 'board_product'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'product'], name='board_product_user_product_idx'),
+            models.Index(fields=['board', 'product'], name='board_product_board_idx'),
+            models.Index(fields=['created_at', 'board'], name='board_product_created_idx'),
+        ]
+
+
+@receiver(post_save, sender=BoardProduct)
+def board_product_save(sender, instance, created, **kwargs):
+    from backend.caches import saved_products_key
+    from django.core.cache import cache
+    key = saved_products_key(instance.user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+    if created:
+        # The counter only holds one day; the first save of a new day restarts it.
+        today = timezone.now().date()
+        Board.objects.filter(pk=instance.board_id).update(
+            new_products_count=Case(When(new_products_date=today, then=F('new_products_count') + 1), default=Value(1)),
+            new_products_date=today,
+        )
+
+
+@receiver(post_delete, sender=BoardProduct)
+def board_product_delete(sender, instance, **kwargs):
+    from backend.caches import saved_products_key
+    from django.core.cache import cache
+    key = saved_products_key(instance.user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+    today = timezone.now().date()
+    if instance.created_at and instance.created_at.date() == today:
+        Board.objects.filter(pk=instance.board_id, new_products_date=today, new_products_count__gt=0) \
+            .update(new_products_count=F('new_products_count') - 1)
 
 
 class BoardFollower(models.Model):
@@ -163,11 +344,26 @@ class BoardFollower(models.Model):
 
     class Meta:
         db_table = 'board_follower'
+        indexes = [
+            models.Index(fields=['board', 'user'], name='board_follower_board_user_idx'),
+            models.Index(fields=['user', 'board'], name='board_follower_user_board_idx'),
+        ]
 
     def __str__(self):
         return self.board.name
 
 
+@receiver(post_save, sender=BoardFollower)
+def board_follower_save(sender, instance, created, **kwargs):
+    if created:
+        Board.objects.filter(pk=instance.board_id).update(followers_count=F('followers_count') + 1)
+
+
+@receiver(post_delete, sender=BoardFollower)
+def board_follower_delete(sender, instance, **kwargs):
+    Board.objects.filter(pk=instance.board_id, followers_count__gt=0).update(followers_count=F('followers_count') - 1)
+
+
 class Ticket(models.Model):
     name = models.CharField(max_length=255)
     email = models.EmailField()
@@ -0,0 +1,190 @@
+import base64
+import binascii
+import json
+import zlib
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from backend.models import SHUFFLE_KEY_RANGE
+
+PAGE_SIZE = 60
+SEED_BUCKETS = 16
+
+
+def encode_cursor(values):
+    """Pack the sort key of the last row of a page into an opaque token."""
+    payload = json.dumps(values, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Unpack a token made by ``encode_cursor``, raising ValueError when it is malformed."""
+    try:
+        padding = '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(token + padding).decode())
+    except (TypeError, UnicodeDecodeError, json.JSONDecodeError, binascii.Error):
+        raise ValueError('invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('invalid cursor')
+    return values
+
+
+def request_seed(request):
+    """Shuffle seed of the browsing session.
+
+    Clients may pin it with ``seed``; otherwise it is derived from the user and
+    the day, so clients that only send ``page`` still get stable pages.  Users
+    are spread over ``SEED_BUCKETS`` orders a day so shuffled pages can be
+    shared through the feed cache.
+    """
+    seed = request.GET.get('seed')
+    if seed is not None:
+        seed = int(seed)
+        if not 0 <= seed < SHUFFLE_KEY_RANGE:
+            raise ValueError('invalid seed')
+        return seed
+    key = "{0}:{1}".format(request.user.id % SEED_BUCKETS, timezone.now().date().isoformat())
+    return zlib.crc32(key.encode()) % SHUFFLE_KEY_RANGE
+
+
+class OffsetPage:
+    """``LIMIT/OFFSET`` page, kept for clients that only send ``page``."""
+
+    def __init__(self, page_number, order, order_params=None, extra=None):
+        self.page_number = page_number
+        self.order = order
+        self.order_params = order_params or []
+        self.extra = extra or {}
+
+    def fetch(self, raw, sql, params):
+        """Run ``sql`` (which must end with its WHERE clause) for this page."""
+        query = "{0} ORDER BY {1} LIMIT %s OFFSET %s".format(sql, self.order)
+        return list(raw(query, params + self.order_params + [PAGE_SIZE, self.page_number * PAGE_SIZE]))
+
+    def paging_fields(self, rows):
+        return dict(self.extra)
+
+    def cache_key(self):
+        return "offset:{0}:{1}:{2}".format(self.order, self.order_params, self.page_number)
+
+
+class ChronologicalPage:
+    """Keyset page over ``(inserted_at, id)``, newest first.
+
+    Every page seeks straight to the row after the cursor instead of skipping
+    ``page * PAGE_SIZE`` rows, so deep pages cost the same as the first one.
+    """
+
+    def __init__(self, token, alias='p'):
+        self.alias = alias
+        self.after = None
+        if token:
+            values = decode_cursor(token)
+            if len(values) != 2:
+                raise ValueError('invalid cursor')
+            inserted_at = parse_datetime(str(values[0]))
+            if inserted_at is None or not isinstance(values[1], int):
+                raise ValueError('invalid cursor')
+            self.after = [inserted_at, values[1]]
+
+    def fetch(self, raw, sql, params):
+        condition = ""
+        condition_params = []
+        if self.after is not None:
+            condition = "and ({0}.inserted_at, {0}.id) < (%s, %s)".format(self.alias)
+            condition_params = self.after
+        query = "{0} {1} ORDER BY {2}.inserted_at desc, {2}.id desc LIMIT %s".format(sql, condition, self.alias)
+        return list(raw(query, params + condition_params + [PAGE_SIZE]))
+
+    def paging_fields(self, rows):
+        next_cursor = None
+        if len(rows) == PAGE_SIZE:
+            last = rows[-1]
+            next_cursor = encode_cursor([last.inserted_at.isoformat(), last.id])
+        return {'next_cursor': next_cursor}
+
+    def cache_key(self):
+        return "chronological:{0}".format(self.after)
+
+
+class ShuffledPage:
+    """Keyset page over a seeded rotation of the ``shuffle_key`` permutation.
+
+    Rows are read in ``(shuffle_key, id)`` order starting at ``seed`` and
+    wrapping around to the keys below it, so each session sees its own
+    random-looking order that never repeats or skips a row between pages.
+    The permutation itself is redrawn nightly by the ``reshuffle`` command,
+    so the orders change from day to day.  Both halves are plain range scans
+    on ``shuffle_key``, so page N costs the same as page 1.  The cursor is
+    ``[seed, wrapped, shuffle_key, id]``.
+    """
+
+    def __init__(self, token, seed, alias='p'):
+        self.alias = alias
+        self.seed = seed
+        self.wrapped = False
+        self.after = None
+        if token:
+            values = decode_cursor(token)
+            if len(values) != 4 or not all(isinstance(value, int) for value in values):
+                raise ValueError('invalid cursor')
+            self.seed, wrapped, key, pk = values
+            self.wrapped = bool(wrapped)
+            self.after = [key, pk]
+
+    def segments(self):
+        after = ""
+        after_params = []
+        if self.after is not None:
+            after = "and ({0}.shuffle_key, {0}.id) > (%s, %s)".format(self.alias)
+            after_params = self.after
+        tail = ("and {0}.shuffle_key < %s".format(self.alias), [self.seed])
+        if self.wrapped:
+            return [("{0} {1}".format(tail[0], after), tail[1] + after_params)]
+        head = ("and {0}.shuffle_key >= %s {1}".format(self.alias, after), [self.seed] + after_params)
+        return [head, tail]
+
+    def fetch(self, raw, sql, params):
+        rows = []
+        for condition, condition_params in self.segments():
+            query = "{0} {1} ORDER BY {2}.shuffle_key, {2}.id LIMIT %s".format(sql, condition, self.alias)
+            rows += list(raw(query, params + condition_params + [PAGE_SIZE - len(rows)]))
+            if len(rows) == PAGE_SIZE:
+                break
+        return rows
+
+    def paging_fields(self, rows):
+        next_cursor = None
+        if len(rows) == PAGE_SIZE:
+            last = rows[-1]
+            wrapped = 1 if last.shuffle_key < self.seed else 0
+            next_cursor = encode_cursor([self.seed, wrapped, last.shuffle_key, last.id])
+        return {'next_cursor': next_cursor, 'seed': self.seed}
+
+    def cache_key(self):
+        return "shuffled:{0}:{1}:{2}".format(self.seed, self.wrapped, self.after)
+
+
+def chronological_page(request, alias='p'):
+    """Newest-first page: keyset when the client sends ``cursor``, offset otherwise."""
+    cursor = request.GET.get('cursor')
+    if cursor is not None:
+        return ChronologicalPage(cursor, alias)
+    page_number = int(request.GET.get('page', 0))
+    return OffsetPage(page_number, "{0}.inserted_at desc, {0}.id desc".format(alias))
+
+
+def shuffled_page(request, alias='p'):
+    """Seeded shuffle page: keyset when the client sends ``cursor``, offset otherwise.
+
+    The offset variant walks the same rotation, so old clients also get pages
+    that don't overlap, just without the constant cost.
+    """
+    seed = request_seed(request)
+    cursor = request.GET.get('cursor')
+    if cursor is not None:
+        return ShuffledPage(cursor, seed, alias)
+    page_number = int(request.GET.get('page', 0))
+    order = "{0}.shuffle_key < %s, {0}.shuffle_key, {0}.id".format(alias)
+    return OffsetPage(page_number, order, [seed], extra={'seed': seed})
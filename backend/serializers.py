@@ -267,7 +267,7 @@ class FollowBoardSerializer(serializers.Serializer):
         try:
             board_follower = BoardFollower.objects.get(board_id=board.id, user_id=self.user.id)
             board_follower.delete()
-            followers = BoardFollower.objects.filter(board_id=board.id).count()
+            followers = Board.objects.values_list('followers_count', flat=True).get(pk=board.id)
             result = {
                 'followers': followers,
                 'is_following': False
@@ -275,7 +275,7 @@ class FollowBoardSerializer(serializers.Serializer):
             return result
         except BoardFollower.DoesNotExist:
             BoardFollower.objects.create(board_id=board.id, user_id=self.user.id)
-            followers = BoardFollower.objects.filter(board_id=board.id).count()
+            followers = Board.objects.values_list('followers_count', flat=True).get(pk=board.id)
             result = {
                 'followers': followers,
                 'is_following': True
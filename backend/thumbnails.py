@@ -0,0 +1,144 @@
+import mimetypes
+import os
+import threading
+import time
+import uuid
+from concurrent import futures
+
+from django.conf import settings
+from PIL import Image, features
+
+THUMBNAIL_WIDTHS = (240, 480, 960)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', {'quality': 60}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+SRCSET_FORMAT = 'webp'
+GENERATE_TIMEOUT = 30
+# A hit only moves a derivative up the LRU order when its mtime is older than this.
+TOUCH_INTERVAL = 60 * 60
+
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
+ThumbnailTimeout = futures.TimeoutError
+
+_executor = None
+_pending = {}
+_lock = threading.RLock()
+_written = 0
+
+
+def thumbnail_format_supported(fmt):
+    if fmt not in THUMBNAIL_FORMATS:
+        return False
+    return fmt == 'jpg' or features.check(fmt)
+
+
+def thumbnail_srcset(filename, fmt=SRCSET_FORMAT):
+    """``srcset`` value listing every width bucket of an image, or None."""
+    if not filename or '/' not in filename:
+        return None
+    return ', '.join("/thumbnails/{0}/{1}/{2} {0}w".format(width, fmt, filename) for width in THUMBNAIL_WIDTHS)
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = futures.ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS,
+                                                   thread_name_prefix='thumbnail')
+        return _executor
+
+
+def get_thumbnail(source, target, width, fmt):
+    """Make sure the derivative exists at ``target``, generating it in the worker pool on a miss.
+
+    Concurrent requests for the same derivative wait on one job.  Raises
+    ``ThumbnailTimeout`` when generation takes longer than ``GENERATE_TIMEOUT``
+    and OSError when the source can't be read as an image.
+    """
+    try:
+        if os.stat(target).st_mtime < time.time() - TOUCH_INTERVAL:
+            os.utime(target)
+        return target
+    except FileNotFoundError:
+        pass
+    with _lock:
+        future = _pending.get(target)
+        if future is None:
+            future = executor().submit(generate_thumbnail, source, target, width, fmt)
+            _pending[target] = future
+            future.add_done_callback(lambda done: forget(target))
+    future.result(timeout=GENERATE_TIMEOUT)
+    return target
+
+
+def forget(target):
+    with _lock:
+        _pending.pop(target, None)
+
+
+def generate_thumbnail(source, target, width, fmt):
+    global _written
+    image_format, options = THUMBNAIL_FORMATS[fmt]
+    with Image.open(source) as image:
+        height = max(1, round(image.height * width / image.width))
+        if image.width > width:
+            # Lets the JPEG decoder scale down while reading instead of decoding full size.
+            image.draft('RGB', (width, height))
+            image = image.resize((width, height), Image.LANCZOS)
+        if fmt == 'jpg' or image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB' if fmt == 'jpg' or 'A' not in image.getbands() else 'RGBA')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp = "{0}.{1}.tmp".format(target, uuid.uuid4().hex)
+        try:
+            image.save(temp, image_format, **options)
+            os.replace(temp, target)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    size = os.path.getsize(target)
+    with _lock:
+        _written += size
+        evict_now = _written >= settings.THUMBNAIL_CACHE_SIZE // 20
+        if evict_now:
+            _written = 0
+    if evict_now:
+        evict_thumbnails()
+    return target
+
+
+def evict_thumbnails(limit=None):
+    """Delete the least recently used derivatives until the cache is under 90% of its limit."""
+    if limit is None:
+        limit = settings.THUMBNAIL_CACHE_SIZE
+    files = []
+    total = 0
+    for path, dirs, names in os.walk(settings.THUMBNAIL_ROOT):
+        for name in names:
+            full_path = os.path.join(path, name)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                # Removed by another worker in the meantime.
+                continue
+            files.append((stat.st_mtime, stat.st_size, full_path))
+            total += stat.st_size
+    if total <= limit:
+        return 0
+
+    files.sort()
+    removed = 0
+    for mtime, size, full_path in files:
+        if total <= limit * 0.9:
+            break
+        try:
+            os.remove(full_path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
@@ -5,7 +5,7 @@ from backend.views import SendResetPasswordLink, ProductsView, CustomAuthToken,
     ProfileView, ProductsByBrandView, ImageView, LogoutView, ToggleFollowBrandView, BrandInfoView, \
     ToggleLoveProduct, MyLovesView, BoardsView, ProductToggleSaveView, BoardsByUsernameView, ProductsByBoardView, \
     BoardInfoView, MyFollowingsView, BoardImageView, TicketView, EmailPreview, ResetPassword, \
-    toggle_follow_board_view, get_total_new_count
+    toggle_follow_board_view, get_total_new_count, ThumbnailView
 
 urlpatterns = [
     path('api/sessions', CustomAuthToken.as_view()),
@@ -34,11 +34,12 @@ urlpatterns = [
     path('api/my-loves', MyLovesView.as_view()),
     path('api/my-followings', MyFollowingsView.as_view()),
 
-    path('api/tickets', TicketView.as_view())
+    path('api/tickets', TicketView.as_view()),
+    path('images/<subdir>/<filename>', ImageView.as_view()),
+    path('thumbnails/<int:width>/<fmt>/<subdir>/<filename>', ThumbnailView.as_view())
 ]
 
 if settings.DEBUG:
     urlpatterns += [
-        path('images/<subdir>/<filename>', ImageView.as_view()),
         path('emails/<name>', EmailPreview.as_view())
     ]
@@ -1,10 +1,16 @@
+import mimetypes
+import re
 from email.mime.image import MIMEImage
+from functools import lru_cache
 
 from django.contrib.auth.models import User
 from django.contrib.staticfiles import finders
 from django.core.mail import EmailMultiAlternatives
 from rest_framework.response import Response
 
+from backend.models import Product
+from backend.thumbnails import thumbnail_srcset
+
 
 def background_image():
     with open(finders.find('images/back.png'), 'rb') as f:
@@ -41,6 +47,49 @@ def api_auth(user, token):
     })
 
 
+@lru_cache(maxsize=64)
+def image_content_type(extension):
+    """MIME type for a file extension, looked up once per extension."""
+    return mimetypes.guess_type("image{0}".format(extension.lower()))[0] or 'application/octet-stream'
+
+
+def parse_byte_range(header, size):
+    """``(start, end)`` of a single ``Range: bytes=`` header, end inclusive.
+
+    Returns None when the header is missing or not a single byte range (the
+    whole file is served then) and raises ValueError when the range lies
+    outside the file.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        raise ValueError('unsatisfiable range')
+    return start, end
+
+
+def read_file_range(f, start, end, block_size=64 * 1024):
+    """Yield bytes ``start``..``end`` of an open file in blocks, closing it at the end."""
+    try:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+    finally:
+        f.close()
+
+
 def make_username(first_name, last_name):
     first_name = first_name.lower()
     last_name = last_name.lower()
@@ -73,16 +122,12 @@ def make_board_list(boards):
 
 
 def make_product_list(products):
+    """Serialize feed rows; the list is the same for every user.
+
+    ``backend.caches.flag_products`` adds the liked/saved flags.
+    """
     product_list = []
     for product in products:
-        if product.liked is None:
-            liked = False
-        else:
-            liked = True
-        if product.saved is None:
-            saved = False
-        else:
-            saved = True
         product_list.append({
             'id': product.id,
             'title': product.title,
@@ -91,10 +136,19 @@ def make_product_list(products):
             'sale_price': product.sale_price,
             'product_link': product.product_link,
             'hq_image_filename': product.hq_image_filename,
+            'image_srcset': thumbnail_srcset(product.image_filename),
+            'hq_image_srcset': thumbnail_srcset(product.hq_image_filename),
             'site': product.site_id,
-            'name': product.site.name,
-            'display_name': product.site.display_name,
-            'liked': liked,
-            'saved': saved
+            'name': product.site_name,
+            'display_name': product.site_display_name,
         })
     return product_list
+
+
+def make_feed_page(page, sql, params):
+    products = page.fetch(Product.objects.raw, sql, params)
+    result = {
+        'data': make_product_list(products)
+    }
+    result.update(page.paging_fields(products))
+    return result
@@ -1,19 +1,24 @@
-import mimetypes
 import os
 import uuid
 from datetime import timedelta
 from shutil import copyfile
+from stat import S_ISREG
+from urllib.parse import quote
 
 import facebook
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation
 from django.core.mail import send_mail
-from django.db import connection
-from django.http import HttpResponse, HttpResponseRedirect
+from django.db import connection, transaction
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils import timezone
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
 from django.utils.crypto import get_random_string
+from django.utils.http import http_date
 from django.views import View
 from google.auth.exceptions import GoogleAuthError
 from google.auth.transport import requests
@@ -28,13 +33,17 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from slugify import slugify
 
+from backend.caches import flag_products, get_feed_page, get_brand_followers, get_brand_info
 from backend.forms import UploadFileForm, TicketForm
 from backend.models import Product, UserProfile, BrandFollower, ProductLove, Board, BoardProduct, \
     BoardFollower, Ticket
+from backend.pagination import chronological_page, shuffled_page, OffsetPage
 from backend.serializers import ForgotPasswordSerializer, TicketSerializer, UserSerializer, CreateBoardSerializer, \
     BoardSerializer, \
     BoardProductSerializer, FollowBoardSerializer, CustomAuthTokenSerializer, ResetPasswordSerializer
-from backend.utils import api_auth, make_username, make_board_list, make_product_list
+from backend.thumbnails import THUMBNAIL_WIDTHS, ThumbnailTimeout, get_thumbnail, thumbnail_format_supported
+from backend.utils import api_auth, make_username, make_board_list, make_feed_page, image_content_type, \
+    parse_byte_range, read_file_range
 
 
 class CustomAuthToken(ObtainAuthToken):
@@ -133,7 +142,6 @@ class ProductsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        page_number = int(request.GET.get('page', 0))
         site_type = request.GET.get('site_type', 0)
         explore_all = request.GET.get('all', False)
         gender = int(request.GET.get('gender', 0))
@@ -144,100 +152,62 @@ class ProductsView(APIView):
             start_time = now.strftime("'%Y-%m-%d 00:00:00'")
             end_time = now.strftime("'%Y-%m-%d 23:59:59'")
             period_condition = "and p.inserted_at between {0} and {1}".format(start_time, end_time)
-            gender_condition = "inserted_at desc"
         elif period == 7:
             start_of_week = now - timedelta(days=now.weekday())
             end_of_week = start_of_week + timedelta(days=6)
             start_time = start_of_week.strftime("'%Y-%m-%d 00:00:00'")
             end_time = end_of_week.strftime("'%Y-%m-%d 23:59:59'")
             period_condition = "and p.inserted_at between {0} and {1}".format(start_time, end_time)
-            gender_condition = "random()"
         else:
             period_condition = ""
-            gender_condition = "random()"
+
+        try:
+            if period == 1:
+                page = chronological_page(request)
+            else:
+                page = shuffled_page(request)
+        except ValueError:
+            return Response({'message': 'Bad request'}, status=status.HTTP_400_BAD_REQUEST)
 
         user = request.user
-        offset = page_number * 60
         if explore_all == 'true':
             if gender == 0:
                 sql = """
-                    SELECT p.*, pl.liked, bp.saved
+                    SELECT p.*
                     FROM products p 
-                            LEFT JOIN sites s ON p.site_id = s.id
-                            left join (select product_id, user_id liked from product_love where user_id = %s) pl on pl.product_id = p.id
-                            left join (select product_id, user_id saved from board_product where user_id = %s group by product_id, user_id) bp on bp.product_id = p.id 
-                    WHERE s.type=%s {0} ORDER BY {1} LIMIT 60 OFFSET %s
-                    """.format(period_condition, gender_condition)
-                products = Product.objects.raw(
-                    sql,
-                    [user.id, user.id, site_type, offset])
+                    WHERE p.site_type=%s {0}
+                    """.format(period_condition)
+                params = [site_type]
             else:
                 sql = """
-                    SELECT p.*, pl.liked, bp.saved
+                    SELECT p.*
                     FROM products p 
-                            LEFT JOIN sites s ON p.site_id = s.id
-                            left join (select product_id, user_id liked from product_love where user_id = %s) pl on pl.product_id = p.id
-                            left join (select product_id, user_id saved from board_product where user_id = %s group by product_id, user_id) bp on bp.product_id = p.id 
-                    WHERE s.type=%s AND s.gender=%s {0} ORDER BY {1} LIMIT 60 OFFSET %s
-                    """.format(period_condition, gender_condition)
-                products = Product.objects.raw(
-                    sql,
-                    [user.id, user.id, site_type, gender, offset])
+                    WHERE p.site_type=%s AND p.site_gender=%s {0}
+                    """.format(period_condition)
+                params = [site_type, gender]
+            # The explore feed is the same for everyone, so pages are shared through the cache.
+            key_parts = ['products', site_type, gender, period, now.date(), page.cache_key()]
+            result = get_feed_page(key_parts, lambda: make_feed_page(page, sql, params))
         else:
             if gender == 0:
                 sql = """
-                    select p.*, pl.liked, bp.saved
+                    select p.*
                     from products p
-                             left join sites s on s.id = p.site_id
-                             left join brand_followers bf on bf.brand_name = s.name
-                             left join (select product_id, user_id liked from product_love where user_id = %s) pl on pl.product_id = p.id
-                             left join (select product_id, user_id saved from board_product where user_id = %s group by product_id, user_id) bp on bp.product_id = p.id
-                    where bf.user_id = %s and s.type = %s {0} order by {1} limit 60 offset %s
-                    """.format(period_condition, gender_condition)
-                products = Product.objects.raw(
-                    sql,
-                    [user.id, user.id, user.id, site_type, offset])
+                    where p.site_name in (select brand_name from brand_followers where user_id = %s)
+                      and p.site_type = %s {0}
+                    """.format(period_condition)
+                params = [user.id, site_type]
             else:
                 sql = """
-                    select p.*, pl.liked, bp.saved
+                    select p.*
                     from products p
-                             left join sites s on s.id = p.site_id
-                             left join brand_followers bf on bf.brand_name = s.name
-                             left join (select product_id, user_id liked from product_love where user_id = %s) pl on pl.product_id = p.id
-                             left join (select product_id, user_id saved from board_product where user_id = %s group by product_id, user_id) bp on bp.product_id = p.id 
-                    where bf.user_id = %s and s.type = %s and s.gender = %s {0} order by {1} limit 60 offset %s
-                    """.format(period_condition, gender_condition)
-                products = Product.objects.raw(
-                    sql,
-                    [user.id, user.id, user.id, site_type, gender, offset])
-
-        product_list = []
-        for product in products:
-            if product.liked is None:
-                liked = False
-            else:
-                liked = True
-            if product.saved is None:
-                saved = False
-            else:
-                saved = True
-            product_list.append({
-                'id': product.id,
-                'title': product.title,
-                'image_filename': product.image_filename,
-                'price': product.price,
-                'sale_price': product.sale_price,
-                'product_link': product.product_link,
-                'hq_image_filename': product.hq_image_filename,
-                'site': product.site_id,
-                'name': product.site.name,
-                'display_name': product.site.display_name,
-                'liked': liked,
-                'saved': saved,
-            })
-        result = {
-            'data': product_list
-        }
+                    where p.site_name in (select brand_name from brand_followers where user_id = %s)
+                      and p.site_type = %s and p.site_gender = %s {0}
+                    """.format(period_condition)
+                params = [user.id, site_type, gender]
+            result = make_feed_page(page, sql, params)
+
+        result['data'] = flag_products(result['data'], user.id)
         return Response(result)
 
 
@@ -245,7 +215,6 @@ class ProductsByBrandView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, name):
-        page_number = int(request.GET.get('page', 0))
         site_type = request.GET.get('site_type', 0)
         gender = int(request.GET.get('gender', 0))
         period = int(request.GET.get("period"))
@@ -254,50 +223,42 @@ class ProductsByBrandView(APIView):
             start_time = now.strftime("'%Y-%m-%d 00:00:00'")
             end_time = now.strftime("'%Y-%m-%d 23:59:59'")
             period_condition = "and p.inserted_at between {0} and {1}".format(start_time, end_time)
-            gender_condition = "inserted_at desc"
         elif period == 7:
             start_of_week = now - timedelta(days=now.weekday())
             end_of_week = start_of_week + timedelta(days=6)
             start_time = start_of_week.strftime("'%Y-%m-%d 00:00:00'")
             end_time = end_of_week.strftime("'%Y-%m-%d 23:59:59'")
             period_condition = "and p.inserted_at between {0} and {1}".format(start_time, end_time)
-            gender_condition = "random()"
         else:
             period_condition = ""
-            gender_condition = "random()"
+
+        try:
+            if period == 1:
+                page = chronological_page(request)
+            else:
+                page = shuffled_page(request)
+        except ValueError:
+            return Response({'message': 'Bad request'}, status=status.HTTP_400_BAD_REQUEST)
 
         user = request.user
 
-        offset = page_number * 60
         if gender == 0:
             sql = """
-                SELECT p.*, pl.liked, bp.saved
+                SELECT p.*
                 FROM products p 
-                        LEFT JOIN sites s ON p.site_id = s.id
-                        left join (select product_id, user_id liked from product_love where user_id = %s) pl on pl.product_id = p.id
-                        left join (select product_id, user_id saved from board_product where user_id = %s group by product_id, user_id) bp on bp.product_id = p.id 
-                WHERE s.type=%s AND s.name=%s {0} ORDER BY {1} LIMIT 60 OFFSET %s
-                """.format(period_condition, gender_condition)
-
-            products = Product.objects.raw(
-                sql,
-                [user.id, user.id, site_type, name, offset])
+                WHERE p.site_type=%s AND p.site_name=%s {0}
+                """.format(period_condition)
+            params = [site_type, name]
         else:
             sql = """
-                SELECT p.*, pl.liked, bp.saved
+                SELECT p.*
                 FROM products p 
-                        LEFT JOIN sites s ON p.site_id = s.id
-                        left join (select product_id, user_id liked from product_love where user_id = %s) pl on pl.product_id = p.id
-                        left join (select product_id, user_id saved from board_product where user_id = %s group by product_id, user_id) bp on bp.product_id = p.id 
-                WHERE s.type=%s AND s.name=%s AND s.gender=%s {0} ORDER BY {1} LIMIT 60 OFFSET %s
-                """.format(period_condition, gender_condition)
-            products = Product.objects.raw(
-                sql,
-                [user.id, user.id, site_type, name, gender, offset])
-        product_list = make_product_list(products)
-        result = {
-            'data': product_list
-        }
+                WHERE p.site_type=%s AND p.site_name=%s AND p.site_gender=%s {0}
+                """.format(period_condition)
+            params = [site_type, name, gender]
+        key_parts = ['brand', name, site_type, gender, period, now.date(), page.cache_key()]
+        result = get_feed_page(key_parts, lambda: make_feed_page(page, sql, params))
+        result['data'] = flag_products(result['data'], user.id)
         return Response(result)
 
 
@@ -309,23 +270,19 @@ class ToggleFollowBrandView(APIView):
         brand_name = payload.get('name')
         if brand_name:
             user = request.user
-            try:
-                brand_follower = BrandFollower.objects.get(brand_name=brand_name, user_id=user.id)
-                brand_follower.delete()
-                followers = BrandFollower.objects.filter(brand_name=brand_name).count()
-                result = {
-                    'followers': followers,
-                    'is_following': False
-                }
-                return Response(result)
-            except BrandFollower.DoesNotExist:
-                BrandFollower.objects.create(brand_name=brand_name, user_id=user.id)
-                followers = BrandFollower.objects.filter(brand_name=brand_name).count()
-                result = {
-                    'followers': followers,
-                    'is_following': True
-                }
-                return Response(result)
+            with transaction.atomic():
+                try:
+                    brand_follower = BrandFollower.objects.get(brand_name=brand_name, user_id=user.id)
+                    brand_follower.delete()
+                    is_following = False
+                except BrandFollower.DoesNotExist:
+                    BrandFollower.objects.create(brand_name=brand_name, user_id=user.id)
+                    is_following = True
+            result = {
+                'followers': get_brand_followers(brand_name),
+                'is_following': is_following
+            }
+            return Response(result)
         else:
             result = {
                 'message': 'Bad request'
@@ -337,17 +294,8 @@ class BrandInfoView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, name):
-        sql = """
-            select count(*) genders from (select gender from sites where name = %s group by gender) g
-            """
-        sql2 = "select display_name from sites where name = %s"
-        with connection.cursor() as cursor:
-            cursor.execute(sql, [name])
-            row = cursor.fetchone()
-            cursor.execute(sql2, [name])
-            row2 = cursor.fetchone()
-
-        followers = BrandFollower.objects.filter(brand_name=name).count()
+        info = get_brand_info(name)
+        followers = get_brand_followers(name)
         user = request.user
         try:
             BrandFollower.objects.get(brand_name=name, user_id=user.id)
@@ -357,8 +305,8 @@ class BrandInfoView(APIView):
         result = {
             'followers': followers,
             'is_following': is_following,
-            'genders': row[0],
-            'display_name': row2[0]
+            'genders': info['genders'],
+            'display_name': info['display_name']
         }
         return Response(result)
 
@@ -392,22 +340,20 @@ class MyLovesView(APIView):
 
     def get(self, request):
         user = request.user
-        page_number = int(request.GET.get('page', 0))
-        offset = page_number * 60
-        products = Product.objects.raw(
+        try:
+            page = shuffled_page(request)
+        except ValueError:
+            return Response({'message': 'Bad request'}, status=status.HTTP_400_BAD_REQUEST)
+        result = make_feed_page(
+            page,
             """
-            select p.*, pl.*, bp.saved
-            from (select product_id, user_id liked from product_love where user_id = %s) pl
-                     left join products p on p.id = pl.product_id
-                     left join (select product_id, user_id saved from board_product where user_id = %s group by product_id, user_id) bp on bp.product_id = p.id 
-            ORDER BY random() LIMIT 60 OFFSET %s
+            select p.*
+            from product_love pl
+                     join products p on p.id = pl.product_id
+            where pl.user_id = %s
             """,
-            [user.id, user.id, offset])
-
-        product_list = make_product_list(products)
-        result = {
-            'data': product_list
-        }
+            [user.id])
+        result['data'] = flag_products(result['data'], user.id)
         return Response(result)
 
 
@@ -443,51 +389,41 @@ class BoardsView(APIView):
                 'product_id': product_id,
             })
         else:
-            page_number = int(request.GET.get('page'))
+            page_number = int(request.GET.get('page', 0))
             sort_type = int(request.GET.get('order'))
-            now = timezone.now()
-            start_time = now.strftime("'%Y-%m-%d 00:00:00'")
-            end_time = now.strftime("'%Y-%m-%d 23:59:59'")
+            today = timezone.now().strftime("'%Y-%m-%d'")
 
-            if sort_type == 0:
-                order = 'random()'
-            elif sort_type == 1:
-                order = 'followers desc'
-            elif sort_type == 2:
-                order = 'newest desc'
-            else:
-                order = 'random()'
-            offset = page_number * 60
+            try:
+                if sort_type == 1:
+                    page = OffsetPage(page_number, 'foo.followers desc, foo.id')
+                elif sort_type == 2:
+                    page = OffsetPage(page_number, 'foo.newest desc, foo.id')
+                else:
+                    page = shuffled_page(request, alias='foo')
+            except ValueError:
+                return Response({'message': 'Bad request'}, status=status.HTTP_400_BAD_REQUEST)
             sql = """
-                select * from (select b.id, name, type, slug, image_filename, username, COALESCE(followers, 0) followers, COALESCE(newest, 0) newest
+                select * from (select b.id, name, type, slug, image_filename, shuffle_key, username, followers_count followers,
+                       case when new_products_date = {0} then new_products_count else 0 end newest
                 from boards b
                          left join auth_user au on b.user_id = au.id
-                         left join (select board_id, count(board_id) followers from board_follower group by board_id) bf
-                                   on b.id = bf.board_id
-                         left join (select count(product_id) newest, board_id
-                                        from board_product
-                                        where created_at between {0} and {1}
-                                        group by board_id) bp on bp.board_id = b.id
                 where b.type = 1
                 union (
-                select b.id, name, type, slug, image_filename, username, COALESCE(followers, 0) followers, COALESCE(newest, 0) newest
+                select b.id, name, type, slug, image_filename, shuffle_key, username, followers_count followers,
+                       case when new_products_date = {0} then new_products_count else 0 end newest
                 from boards b
                          left join auth_user au on b.user_id = au.id
-                         left join (select board_id, count(board_id) followers from board_follower group by board_id) bf
-                                   on b.id = bf.board_id
-                         left join (select count(product_id) newest, board_id
-                                        from board_product
-                                        where created_at between {0} and {1}
-                                        group by board_id) bp on bp.board_id = b.id
                 where b.type = 0 and b.user_id = %s
                 )) foo
-                order by {2} limit 60 offset %s
-                """.format(start_time, end_time, order)
-            boards = Board.objects.raw(sql, [user.id, offset])
+                where true
+                """.format(today)
+            boards = page.fetch(Board.objects.raw, sql, [user.id])
             board_list = make_board_list(boards)
-            return Response({
+            result = {
                 'data': board_list,
-            })
+            }
+            result.update(page.paging_fields(boards))
+            return Response(result)
 
     def post(self, request):
         user = request.user
@@ -522,46 +458,36 @@ class BoardsByUsernameView(APIView):
 
     def get(self, request, username):
         user = request.user
-        page_number = int(request.GET.get('page'))
-        offset = page_number * 60
-        now = timezone.now()
-        start_time = now.strftime("'%Y-%m-%d 00:00:00'")
-        end_time = now.strftime("'%Y-%m-%d 23:59:59'")
+        try:
+            page = shuffled_page(request, alias='b')
+        except ValueError:
+            return Response({'message': 'Bad request'}, status=status.HTTP_400_BAD_REQUEST)
+        today = timezone.now().strftime("'%Y-%m-%d'")
 
         if user.username == username:
             sql = """
-                select b.id, name, slug, type, image_filename, username, followers, COALESCE(newest, 0) newest
+                select b.id, name, slug, type, image_filename, b.shuffle_key, username, b.followers_count followers,
+                       case when b.new_products_date = {0} then b.new_products_count else 0 end newest
                 from boards b
                          left join auth_user au on b.user_id = au.id
-                         left join (select board_id, count(board_id) followers from board_follower group by board_id) bf
-                                   on b.id = bf.board_id
-                         left join (select count(product_id) newest, board_id
-                                        from board_product
-                                        where created_at between {0} and {1}
-                                        group by board_id) bp on bp.board_id = b.id
                 where au.username = %s
-                order by random() limit 60 offset %s
-                """.format(start_time, end_time)
+                """.format(today)
         else:
             sql = """
-                select b.id, name, slug, type, image_filename, username, followers, COALESCE(newest, 0) newest
+                select b.id, name, slug, type, image_filename, b.shuffle_key, username, b.followers_count followers,
+                       case when b.new_products_date = {0} then b.new_products_count else 0 end newest
                 from boards b
                          left join auth_user au on b.user_id = au.id
-                         left join (select board_id, count(board_id) followers from board_follower group by board_id) bf
-                                   on b.id = bf.board_id
-                         left join (select count(product_id) newest, board_id
-                                        from board_product
-                                        where created_at between {0} and {1}
-                                        group by board_id) bp on bp.board_id = b.id
                 where b.type = 1 and au.username = %s
-                order by random() limit 60 offset %s
-                """.format(start_time, end_time)
+                """.format(today)
 
-        boards = Board.objects.raw(sql, [username, offset])
+        boards = page.fetch(Board.objects.raw, sql, [username])
         board_list = make_board_list(boards)
-        return Response({
+        result = {
             'data': board_list,
-        })
+        }
+        result.update(page.paging_fields(boards))
+        return Response(result)
 
 
 class ProductsByBoardView(APIView):
@@ -570,24 +496,17 @@ class ProductsByBoardView(APIView):
     def get(self, request, username, slug):
         user = request.user
         board = Board.objects.get(slug=slug, user__username=username)
-        page_number = int(request.GET.get('page'))
-        offset = page_number * 60
+        try:
+            page = shuffled_page(request)
+        except ValueError:
+            return Response({'message': 'Bad request'}, status=status.HTTP_400_BAD_REQUEST)
         sql = """
-            select p.*, bp.user_id saved, pl.liked
-            from (select board_id, product_id from board_product where board_id = %s group by product_id, board_id) b
-                     left join (select product_id, user_id from board_product where user_id = %s group by product_id, user_id) bp on bp.product_id = b.product_id
-                     left join products p on p.id = b.product_id
-                     left join (select product_id, user_id liked from product_love where user_id = %s) pl on pl.product_id = p.id 
-            order by random() LIMIT 60 OFFSET %s
+            select p.*
+            from products p
+            where p.id in (select product_id from board_product where board_id = %s)
             """
-        products = Product.objects.raw(
-            sql,
-            [board.id, user.id, user.id, offset])
-
-        product_list = make_product_list(products)
-        result = {
-            'data': product_list
-        }
+        result = make_feed_page(page, sql, [board.id])
+        result['data'] = flag_products(result['data'], user.id)
         return Response(result)
 
 
@@ -598,7 +517,7 @@ class BoardInfoView(APIView):
         user = request.user
         board = Board.objects.get(slug=slug, user__username=username)
 
-        followers = BoardFollower.objects.filter(board__slug=slug).count()
+        followers = board.followers_count
         try:
             BoardFollower.objects.get(board__slug=slug, user_id=user.id)
             is_following = True
@@ -716,32 +635,28 @@ class MyFollowingsView(APIView):
 
     def get(self, request):
         user = request.user
-        page_number = int(request.GET.get('page'))
-        offset = page_number * 60
-        now = timezone.now()
-        start_time = now.strftime("'%Y-%m-%d 00:00:00'")
-        end_time = now.strftime("'%Y-%m-%d 23:59:59'")
+        try:
+            page = shuffled_page(request, alias='b')
+        except ValueError:
+            return Response({'message': 'Bad request'}, status=status.HTTP_400_BAD_REQUEST)
+        today = timezone.now().strftime("'%Y-%m-%d'")
 
         sql = """
-        select b.*, bf2.followers, au.username, bf.user_id follower_id, COALESCE(bp.newest, 0) newest
+        select b.*, b.followers_count followers, au.username, bf.user_id follower_id,
+               case when b.new_products_date = {0} then b.new_products_count else 0 end newest
         from board_follower bf
                  left join boards b on bf.board_id = b.id
-                 left join (select board_id, count(board_id) followers from board_follower group by board_id) bf2
-                           on bf2.board_id = b.id
-                 left join (select count(product_id) newest, board_id
-                            from board_product
-                            where created_at between {0} and {1}
-                            group by board_id) bp on bp.board_id = b.id
                  left join auth_user au on b.user_id = au.id
         where b.type = 1 and bf.user_id= %s
-        order by random() limit 60 offset %s
-        """.format(start_time, end_time)
+        """.format(today)
 
-        boards = Board.objects.raw(sql, [user.id, offset])
+        boards = page.fetch(Board.objects.raw, sql, [user.id])
         board_list = make_board_list(boards)
-        return Response({
+        result = {
             'data': board_list,
-        })
+        }
+        result.update(page.paging_fields(boards))
+        return Response(result)
 
 
 class TicketView(APIView):
@@ -781,23 +696,14 @@ class ReplyTicket(View):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_total_new_count(request):
-    now = timezone.now()
-    start_time = now.strftime("'%Y-%m-%d 00:00:00'")
-    end_time = now.strftime("'%Y-%m-%d 23:59:59'")
+    today = timezone.now().strftime("'%Y-%m-%d'")
 
     sql = """
-        select COALESCE(sum(bp.newest), 0) total_new
+        select COALESCE(sum(b.new_products_count), 0) total_new
         from board_follower bf
                  left join boards b on bf.board_id = b.id
-                 left join (select board_id, count(board_id) followers from board_follower group by board_id) bf2
-                           on bf2.board_id = b.id
-                 left join (select count(product_id) newest, board_id
-                            from board_product
-                            where created_at between {0} and {1}
-                            group by board_id) bp on bp.board_id = b.id
-                 left join auth_user au on b.user_id = au.id
-        where b.type = 1 and bf.user_id= %s
-        """.format(start_time, end_time)
+        where b.type = 1 and bf.user_id= %s and b.new_products_date = {0}
+        """.format(today)
     with connection.cursor() as cursor:
         cursor.execute(sql, [request.user.id])
         row = cursor.fetchone()
@@ -807,16 +713,89 @@ def get_total_new_count(request):
 
 
 class ImageView(View):
+    root_setting = 'IMAGES_ROOT'
+    accel_redirect_setting = 'IMAGES_ACCEL_REDIRECT'
+
     def get(self, request, subdir, filename):
         try:
-            with open("/home/deploy/images/{0}/{1}".format(subdir, filename), "rb") as f:
-                mime = mimetypes.MimeTypes().guess_type("/home/deploy/images/{0}/{1}".format(subdir, filename))[0]
-                response = HttpResponse(f.read(), content_type=mime)
-                return response
-        except IOError:
-            response = HttpResponse(status=404)
+            path = safe_join(getattr(settings, self.root_setting), subdir, filename)
+        except SuspiciousFileOperation:
+            return HttpResponse(status=404)
+        return self.serve(request, path)
+
+    def serve(self, request, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return HttpResponse(status=404)
+        if not S_ISREG(stat.st_mode):
+            return HttpResponse(status=404)
+
+        etag = '"{0:x}-{1:x}"'.format(int(stat.st_mtime), stat.st_size)
+        last_modified = int(stat.st_mtime)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.file_response(request, path, stat.st_size, etag, last_modified,
+                                          image_content_type(os.path.splitext(path)[1]))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def file_response(self, request, path, size, etag, last_modified, content_type):
+        accel_redirect = getattr(settings, self.accel_redirect_setting)
+        if accel_redirect:
+            # nginx sends the file itself and handles Range from here on.
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = accel_redirect + quote(
+                os.path.relpath(path, getattr(settings, self.root_setting)))
             return response
 
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range or if_range in (etag, http_date(last_modified)):
+            try:
+                byte_range = parse_byte_range(request.META.get('HTTP_RANGE'), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{0}'.format(size)
+                return response
+
+        if byte_range is None:
+            # FileResponse goes through wsgi.file_wrapper, so gunicorn can sendfile() it.
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_file_range(open(path, 'rb'), start, end),
+                                             status=206, content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, size)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+
+class ThumbnailView(ImageView):
+    """Width-bucketed WebP/AVIF/JPEG copy of an image, generated on first request."""
+    root_setting = 'THUMBNAIL_ROOT'
+    accel_redirect_setting = 'THUMBNAIL_ACCEL_REDIRECT'
+
+    def get(self, request, width, fmt, subdir, filename):
+        if width not in THUMBNAIL_WIDTHS or not thumbnail_format_supported(fmt):
+            return HttpResponse(status=404)
+        try:
+            source = safe_join(settings.IMAGES_ROOT, subdir, filename)
+            target = safe_join(settings.THUMBNAIL_ROOT, str(width), subdir, "{0}.{1}".format(filename, fmt))
+        except SuspiciousFileOperation:
+            return HttpResponse(status=404)
+        if not os.path.isfile(source):
+            return HttpResponse(status=404)
+        try:
+            get_thumbnail(source, target, width, fmt)
+        except ThumbnailTimeout:
+            return HttpResponse(status=503)
+        except OSError:
+            return HttpResponse(status=404)
+        return self.serve(request, target)
+
 
 class EmailPreview(View):
     def get(self, request, name):
@@ -44,12 +44,15 @@ INSTALLED_APPS = [
     'scraping',
 ]
 
-# CACHES = {
-#     'default': {
-#         'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
-#         'LOCATION': '127.0.0.1:11211',
-#     }
-# }
+# The web workers and the scrapyd crawls must share this cache: the per-user id sets are dropped by whichever
+# process changed them, so a per-process cache like LocMemCache serves stale liked/saved flags, and the crawls
+# expire the cached feed pages, which are therefore not cached at all under LocMemCache.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.memcached.PyMemcacheCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', '127.0.0.1:11211'),
+    }
+}
 
 MIDDLEWARE = [
     # 'django.middleware.cache.UpdateCacheMiddleware',
@@ -124,6 +127,17 @@ MEDIA_URL = '/uploads/'
 STATIC_ROOT = os.path.join(BASE_DIR, "backend-static")
 MEDIA_ROOT = os.path.join(BASE_DIR, "uploads")
 
+# Scraped product and board images. When IMAGES_ACCEL_REDIRECT is set (e.g. "/protected-images/"),
+# ImageView only checks the request and leaves the transfer to an nginx internal location with that prefix.
+IMAGES_ROOT = os.getenv('IMAGES_ROOT', '/home/deploy/images')
+IMAGES_ACCEL_REDIRECT = os.getenv('IMAGES_ACCEL_REDIRECT', '')
+
+# Resized WebP/AVIF copies made by ThumbnailView, evicted least recently used first past THUMBNAIL_CACHE_SIZE bytes.
+THUMBNAIL_ROOT = os.getenv('THUMBNAIL_ROOT', '/home/deploy/thumbnails')
+THUMBNAIL_ACCEL_REDIRECT = os.getenv('THUMBNAIL_ACCEL_REDIRECT', '')
+THUMBNAIL_CACHE_SIZE = int(os.getenv('THUMBNAIL_CACHE_SIZE', 2 * 1024 ** 3))
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+
 SIMPLEUI_STATIC_OFFLINE = True
 SIMPLEUI_HOME_INFO = False
 
@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+from django.db.models import F
+
+from backend.models import FIRST_CHECK_AGE, Product
+
+
+class Command(BaseCommand):
+    help = "Schedule the first check of never checked products FIRST_CHECK_AGE after they were scraped"
+
+    def handle(self, *args, **kwargs):
+        count = Product.objects.filter(last_checked_at__isnull=True).update(
+            next_check_at=F('inserted_at') + FIRST_CHECK_AGE)
+        print("{0} products scheduled.".format(count))
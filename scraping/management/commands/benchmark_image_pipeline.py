@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import time
+
+import scrapy
+from django.core.management import BaseCommand
+from PIL import Image
+from scrapy.crawler import CrawlerRunner
+from scrapy.settings import Settings
+from twisted.internet import defer
+
+
+class FixtureSpider(scrapy.Spider):
+    name = 'image_benchmark'
+
+    def __init__(self, base_url, count, **kwargs):
+        super().__init__(**kwargs)
+        self.start_urls = [base_url]
+        self.count = count
+
+    def parse(self, response, **kwargs):
+        for i in range(self.count):
+            yield {'image_urls': ["{0}{1}.jpg".format(self.start_urls[0], i)]}
+
+
+class Command(BaseCommand):
+    help = "Crawl fixture images from a local server with and without the image thread pool and compare reactor stalls"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=200, help='number of fixture images')
+        parser.add_argument('--width', type=int, default=1500, help='fixture image width')
+        parser.add_argument('--height', type=int, default=2000, help='fixture image height')
+        parser.add_argument('--threads', type=int, default=4, help='IMAGES_THREADS of the pooled run')
+
+    def handle(self, *args, **kwargs):
+        from twisted.internet import reactor
+        from twisted.web.server import Site
+        from twisted.web.static import File
+
+        work_dir = tempfile.mkdtemp(prefix='image-benchmark-')
+        try:
+            fixtures_dir = os.path.join(work_dir, 'fixtures')
+            self.make_fixtures(fixtures_dir, kwargs['images'], kwargs['width'], kwargs['height'])
+            port = reactor.listenTCP(0, Site(File(fixtures_dir)), interface='127.0.0.1')
+            base_url = "http://127.0.0.1:{0}/".format(port.getHost().port)
+            results = []
+
+            @defer.inlineCallbacks
+            def run():
+                try:
+                    for threads in (0, kwargs['threads']):
+                        runner = CrawlerRunner(self.crawl_settings(os.path.join(work_dir, str(threads)), threads))
+                        crawler = runner.create_crawler(FixtureSpider)
+                        started = time.monotonic()
+                        yield runner.crawl(crawler, base_url=base_url, count=kwargs['images'])
+                        results.append((threads, time.monotonic() - started, crawler.stats.get_stats()))
+                finally:
+                    yield port.stopListening()
+                    reactor.stop()
+
+            reactor.callWhenRunning(run)
+            reactor.run()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        for threads, elapsed, stats in results:
+            self.stdout.write("=== IMAGES_THREADS = {0}".format(threads))
+            self.stdout.write("    crawl time:     {0:.2f}s".format(elapsed))
+            self.stdout.write("    images stored:  {0}".format(stats.get('file_status_count/downloaded', 0)))
+            self.stdout.write("    reactor stalls: {0} ({1:.2f}s in total)".format(
+                stats.get('reactor/stalls', 0), stats.get('reactor/stall_time', 0)))
+            self.stdout.write("    longest stall:  {0:.3f}s".format(stats.get('reactor/stall_max', 0)))
+
+    def make_fixtures(self, fixtures_dir, count, width, height):
+        os.makedirs(fixtures_dir)
+        # Noise doesn't compress, so every fixture costs a realistic amount to decode and re-encode.
+        noise = Image.merge('RGB', [Image.effect_noise((width, height), 64) for band in range(3)])
+        for i in range(count):
+            noise.rotate(180 * (i % 2)).save(os.path.join(fixtures_dir, "{0}.jpg".format(i)), quality=90)
+
+    def crawl_settings(self, store, threads):
+        return Settings({
+            'ITEM_PIPELINES': {'scrapy_app.pipelines.KnownImagesPipeline': 1},
+            'EXTENSIONS': {'scrapy_app.extensions.ReactorStallMonitor': 500},
+            'IMAGES_STORE': store,
+            'IMAGES_THREADS': threads,
+            'REACTOR_STALL_MONITOR_ENABLED': True,
+            'ROBOTSTXT_OBEY': False,
+            'TELNETCONSOLE_ENABLED': False,
+            'TWISTED_REACTOR': None,
+            'LOG_LEVEL': 'WARNING',
+        })
@@ -0,0 +1,153 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management import BaseCommand
+from scrapy.settings import Settings
+
+from scrapy_app.webdrivers import make_driver_factory, scroll_until_stable
+
+# Category page that renders PAGE_SIZE products at a time and fetches the next page from
+# /items when the last product comes into view, like the infinite-scroll shops do.
+FIXTURE_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<style>
+.product {{ height: 420px; margin: 8px; background: #eee; }}
+.product img {{ width: 100px; height: 150px; }}
+</style>
+</head>
+<body>
+<div id="products"></div>
+<script>
+var total = {total}, pageSize = {page_size}, loaded = 0, loading = false;
+var images = new IntersectionObserver(function (entries) {{
+    entries.forEach(function (entry) {{
+        if (entry.isIntersecting && !entry.target.src) {{
+            entry.target.src = entry.target.dataset.src;
+            images.unobserve(entry.target);
+        }}
+    }});
+}});
+var more = new IntersectionObserver(function (entries) {{
+    if (entries[0].isIntersecting) {{ loadPage(); }}
+}});
+function loadPage() {{
+    if (loading || loaded >= total) {{ return; }}
+    loading = true;
+    fetch('/items?from=' + loaded).then(function (response) {{ return response.text(); }}).then(function () {{
+        var container = document.getElementById('products');
+        for (var i = 0; i < pageSize && loaded < total; i++, loaded++) {{
+            var product = document.createElement('div');
+            product.className = 'product';
+            var image = document.createElement('img');
+            image.dataset.src = '/image?id=' + loaded;
+            product.appendChild(image);
+            container.appendChild(product);
+            images.observe(image);
+        }}
+        more.disconnect();
+        more.observe(container.lastElementChild);
+        loading = false;
+    }});
+}}
+loadPage();
+</script>
+</body>
+</html>
+"""
+
+# 1x1 transparent GIF.
+PIXEL = bytes.fromhex('47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b')
+
+
+def make_handler(page, latency):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == '/':
+                self.respond(page.encode(), 'text/html')
+            elif path == '/items':
+                time.sleep(latency)
+                self.respond(str(parse_qs(urlparse(self.path).query)).encode(), 'text/plain')
+            elif path == '/image':
+                time.sleep(latency / 4)
+                self.respond(PIXEL, 'image/gif')
+            else:
+                self.send_error(404)
+
+        def respond(self, body, content_type):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureHandler
+
+
+def fixed_scroll(browser, pause, step):
+    """The fixed-sleep scrolling the spiders used before scroll_until_stable."""
+    position = 0
+    time.sleep(pause)
+    while True:
+        position = position + step
+        browser.execute_script("window.scrollTo(0, {0});".format(position))
+        time.sleep(pause)
+        document_height = browser.execute_script("return document.body.scrollHeight")
+        if document_height < position:
+            break
+    return browser.execute_script("return document.querySelectorAll('.product').length")
+
+
+class Command(BaseCommand):
+    help = "Load an infinite-scroll fixture page in a browser with fixed sleeps and with scroll_until_stable"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=240, help='number of products on the fixture page')
+        parser.add_argument('--page-size', type=int, default=24, help='products rendered per fetch')
+        parser.add_argument('--latency', type=float, default=0.3, help='seconds the fixture server takes per fetch')
+        parser.add_argument('--pause', type=float, default=1.5, help='sleep per step of the fixed scroll')
+        parser.add_argument('--step', type=int, default=1000, help='pixels per step of the fixed scroll')
+        parser.add_argument('--driver', default='firefox', help='SELENIUM_DRIVER_NAME to benchmark with')
+        parser.add_argument('--driver-path', help='SELENIUM_DRIVER_EXECUTABLE_PATH, e.g. a chromedriver')
+        parser.add_argument('--browser-path', help='SELENIUM_BROWSER_EXECUTABLE_PATH, e.g. a chrome-headless-shell')
+        parser.add_argument('--browser-argument', action='append', dest='browser_arguments',
+                            help='SELENIUM_DRIVER_ARGUMENTS entry, can be repeated (default -headless)')
+        parser.add_argument('--command-executor', help='SELENIUM_COMMAND_EXECUTOR of a remote Selenium server')
+
+    def handle(self, *args, **kwargs):
+        page = FIXTURE_PAGE.format(total=kwargs['products'], page_size=kwargs['page_size'])
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(page, kwargs['latency']))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:{0}/".format(server.server_address[1])
+
+        make_driver = make_driver_factory(Settings({
+            'SELENIUM_DRIVER_NAME': kwargs['driver'],
+            'SELENIUM_DRIVER_EXECUTABLE_PATH': kwargs['driver_path'],
+            'SELENIUM_BROWSER_EXECUTABLE_PATH': kwargs['browser_path'],
+            'SELENIUM_DRIVER_ARGUMENTS': kwargs['browser_arguments'],
+            'SELENIUM_COMMAND_EXECUTOR': kwargs['command_executor'],
+        }))
+        browser = make_driver()
+        try:
+            runs = [
+                ('fixed sleeps', lambda: fixed_scroll(browser, kwargs['pause'], kwargs['step'])),
+                ('scroll_until_stable', lambda: scroll_until_stable(browser, '.product')),
+            ]
+            for label, scroll in runs:
+                browser.get('about:blank')
+                started = time.monotonic()
+                browser.get(url)
+                count = scroll()
+                elapsed = time.monotonic() - started
+                self.stdout.write("{0:<20} {1:>7.2f}s  {2}/{3} products loaded".format(
+                    label, elapsed, count, kwargs['products']))
+        finally:
+            browser.quit()
+            server.shutdown()
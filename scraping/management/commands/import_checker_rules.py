@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand
+
+from scraping.models import CheckerRule
+
+# The availability checks of the per-shop checker spiders the rules replaced.
+DEFAULT_RULES = [
+    {'name': 'Allsaints', 'url_pattern': 'allsaints.com', 'redirect_gone': True,
+     'gone_url_markers': 'style,any/colour,any/size,any/'},
+    {'name': 'Anthropologie', 'url_pattern': 'anthropologie.com', 'render': True, 'download_delay': 30,
+     'gone_selectors': '.c-pwa-product-oos-rec-tray__lead-message\n.s-404-text',
+     'command_executor': 'http://localhost:4444/wd/hub'},
+    {'name': 'Aritzia', 'url_pattern': 'aritzia.com', 'gone_titles': '404'},
+    {'name': 'Bandier', 'url_pattern': 'bandier.com', 'gone_titles': '404'},
+    {'name': 'Fashionbunker', 'url_pattern': 'fashionbunker.com', 'available_selectors': '.product-info-main'},
+    {'name': 'Free People', 'url_pattern': 'freepeople.com', 'render': True,
+     'gone_selectors': '.c-pwa-product-oos-rec-tray__lead-message'},
+    {'name': 'Lole', 'url_pattern': 'lolelife.com', 'gone_titles': '404'},
+    {'name': 'Pull&Bear', 'url_pattern': 'pullandbear.com', 'available_selectors': '#productCard',
+     'gone_titles': 'null'},
+    {'name': 'Scotch & Soda', 'url_pattern': 'scotch-soda.com', 'available_selectors': '#js-pdp-top-dynamic'},
+    {'name': 'Simons', 'url_pattern': 'simons.ca', 'render': True,
+     'gone_selectors': '#outOfStockBanner\n#OutOfStockPopup'},
+    {'name': '& Other Stories', 'url_pattern': 'stories.com', 'available_selectors': '#product_detail'},
+    {'name': 'Ted Baker', 'url_pattern': 'tedbaker.com', 'available_selectors': '#product_detail'},
+    {'name': 'Tory Burch', 'url_pattern': 'toryburch.com', 'render': True, 'gone_selectors': '.error-3Kn'},
+    {'name': 'Urban Outfitters', 'url_pattern': 'urbanoutfitters.com', 'render': True,
+     'gone_selectors': '.c-pwa-tile-no-results\n.c-pwa-404\n.c-pwa-product-oos-rec-tray__lead-message'},
+    {'name': 'Zara', 'url_pattern': 'zara.com', 'available_selectors': '#product', 'gone_titles': 'Search'},
+]
+
+
+class Command(BaseCommand):
+    help = "Create the checker rules of the shops the per-shop checker spiders used to check"
+
+    def handle(self, *args, **kwargs):
+        created = 0
+        for rule in DEFAULT_RULES:
+            url_pattern = rule['url_pattern']
+            defaults = {key: value for key, value in rule.items() if key != 'url_pattern'}
+            created += CheckerRule.objects.get_or_create(url_pattern=url_pattern, defaults=defaults)[1]
+        print("{0} checker rules created.".format(created))
@@ -2,9 +2,9 @@ import os
 
 from django.core.management import BaseCommand
 
-from backend.models import Site
 from bigaray.settings import base
 from scraping.models import Scraper, ProductChecker
+from scraping.sites import get_site
 
 
 class Command(BaseCommand):
@@ -22,16 +22,9 @@ class Command(BaseCommand):
                     except ProductChecker.DoesNotExist:
                         ProductChecker.objects.create(name=a, file=filepath)
                 else:
-                    b = a.capitalize()
-                    c = b.split('_')
-                    brand_name = c[0]
-                    gender = c[1]
-                    brand_type = c[2]
-                    try:
-                        site = Site.objects.get(name=brand_name, gender=int(gender), type=int(brand_type))
+                    site = get_site(a.capitalize())
+                    if site is not None:
                         try:
                             Scraper.objects.get(site=site)
                         except Scraper.DoesNotExist:
                             Scraper.objects.create(site=site, file=filepath)
-                    except Site.DoesNotExist:
-                        pass
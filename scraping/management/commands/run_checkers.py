@@ -2,11 +2,14 @@ from django.core.management import BaseCommand
 
 from scraping.models import ProductChecker
 
+# One spider checks every shop, by the CheckerRule table.
+CHECKER_SPIDER = 'products_checker'
+
 
 class Command(BaseCommand):
-    help = "run all checkers"
+    help = "run the product checker"
 
     def handle(self, *args, **options):
-        checkers = ProductChecker.objects.all()
-        for checker in checkers:
-            checker.start()
+        checker, created = ProductChecker.objects.get_or_create(
+            name=CHECKER_SPIDER, defaults={'file': 'spiders/{0}.py'.format(CHECKER_SPIDER)})
+        checker.start()
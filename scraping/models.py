@@ -1,6 +1,7 @@
 import os
 
 from django.contrib import admin
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
@@ -209,3 +210,56 @@ class ProductCheckerAdmin(admin.ModelAdmin):
 
     spider_log.short_description = "Log"
     spider_log.allow_tags = True
+
+
+def split_lines(text):
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+class CheckerRule(models.Model):
+    """How the product checker tells whether a shop still sells a product; see scrapy_app.checkers.CheckRules."""
+    name = models.CharField(max_length=255)
+    url_pattern = models.CharField(max_length=255, unique=True,
+                                   help_text='Product links containing this text are checked with the rule.')
+    available_selectors = models.TextField(blank=True, help_text='CSS selectors, one per line, that only '
+                                                                 'pages of available products have.')
+    gone_selectors = models.TextField(blank=True, help_text='CSS selectors, one per line, that only pages of '
+                                                            'products no longer sold have.')
+    gone_titles = models.TextField(blank=True, help_text='Page title fragments, one per line, of products no '
+                                                         'longer sold.')
+    gone_url_markers = models.TextField(blank=True, help_text='URL fragments, one per line, of the pages shops '
+                                                              'send products no longer sold to.')
+    redirect_gone = models.BooleanField(default=False, help_text='Redirected product links are no longer sold.')
+    render = models.BooleanField(default=False, help_text='Pages are built in the browser, so only a browser '
+                                                          'can tell that a product is still sold.')
+    concurrency = models.PositiveIntegerField(default=8, validators=[MinValueValidator(1)],
+                                              help_text='Requests at a time to the shop.')
+    download_delay = models.FloatField(default=0, help_text='Seconds between requests to the shop.')
+    command_executor = models.CharField(max_length=255, blank=True,
+                                        help_text='URL of the Selenium server that renders the shop\'s pages, '
+                                                  'e.g. http://localhost:4444/wd/hub; blank for the local browser.')
+
+    class Meta:
+        ordering = ['url_pattern']
+
+    def __str__(self):
+        return self.name
+
+    def check_rules(self):
+        from scrapy_app.checkers import CheckRules
+        return CheckRules(
+            available_selectors=split_lines(self.available_selectors),
+            gone_selectors=split_lines(self.gone_selectors),
+            gone_titles=split_lines(self.gone_titles),
+            gone_url_markers=split_lines(self.gone_url_markers),
+            redirect_gone=self.redirect_gone,
+            render=self.render,
+            slot=self.url_pattern,
+            command_executor=self.command_executor or None,
+        )
+
+
+class CheckerRuleAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'url_pattern', 'redirect_gone', 'render', 'concurrency', 'download_delay',
+                    'command_executor',)
+    search_fields = ('name', 'url_pattern',)
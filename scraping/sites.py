@@ -0,0 +1,38 @@
+from django.utils import timezone
+
+from backend.models import Site
+from scraping.models import ProductChecker, Scraper
+
+# Product spiders are named "<site name>_<gender>_<type>"; each one scrapes a single Site.
+_sites = {}
+
+
+def split_spider_name(spider_name):
+    """``(name, gender, type)`` of a product spider name, or None for checkers and other spiders."""
+    keys = spider_name.split('_')
+    if len(keys) != 3 or not keys[1].isdigit() or not keys[2].isdigit():
+        return None
+    return keys[0], int(keys[1]), int(keys[2])
+
+
+def get_site(spider_name):
+    """Site scraped by the spider, looked up once per process; None when there is no such site."""
+    if spider_name not in _sites:
+        site = None
+        keys = split_spider_name(spider_name)
+        if keys is not None:
+            site = Site.objects.filter(name=keys[0], gender=keys[1], type=keys[2]).first()
+        _sites[spider_name] = site
+    return _sites[spider_name]
+
+
+def mark_scraped(spider_name):
+    """Stamp ``last_scraped`` on the scraper of the spider's site."""
+    site = get_site(spider_name)
+    if site is not None:
+        Scraper.objects.filter(site=site).update(last_scraped=timezone.now())
+
+
+def mark_checked(spider_name):
+    """Stamp ``last_scraped`` on the product checker of the spider."""
+    ProductChecker.objects.filter(name=spider_name).update(last_scraped=timezone.now())
@@ -0,0 +1,197 @@
+from shutil import which
+
+import scrapy
+from django.utils import timezone
+from scrapy import signals
+from scrapy_selenium import SeleniumRequest
+
+from backend.models import Product
+from scraping.models import CheckerRule
+from scraping.sites import mark_checked
+from scrapy_app.items import ProductItem
+
+# Statuses that answer the check without looking any further.
+GONE_STATUSES = {404, 410}
+# Statuses passed to the check instead of being retried or redirected; all but 200 and the gone
+# ones mean the site didn't let the request through and a browser has to look.
+HTTP_CHECK_STATUSES = [404, 410, 401, 403, 405, 429, 500, 502, 503, 504]
+BLOCKED_TITLES = ('Access Denied',)
+
+
+class CheckRules:
+    """How to tell from a product page whether the product is still sold.
+
+    A product is gone when the page answers 404 or 410, when it was
+    redirected and ``redirect_gone`` is set, or when the final URL, the
+    title or the page contain one of the ``gone_*`` markers.  It is
+    available when the page has one of ``available_selectors``, or, when
+    there are none, when nothing marked it gone.
+
+    Plain HTTP responses can be ambiguous and make ``status`` return None:
+    pages the site didn't let through, pages the site renders in the
+    browser (``render``) and pages missing their available marker.  Pages
+    ``rendered`` in a browser always get a status; there a missing
+    available marker means the product is gone.  Requests for the shop
+    share the ``slot`` download slot, and its pages are rendered on the
+    ``command_executor`` Selenium server when it has one.
+    """
+
+    def __init__(self, available_selectors=(), gone_selectors=(), gone_titles=(), gone_url_markers=(),
+                 redirect_gone=False, render=False, slot=None, command_executor=None):
+        self.available_selectors = available_selectors
+        self.gone_selectors = gone_selectors
+        self.gone_titles = gone_titles
+        self.gone_url_markers = gone_url_markers
+        self.redirect_gone = redirect_gone
+        self.render = render
+        self.slot = slot
+        self.command_executor = command_executor
+
+    @property
+    def needs_body(self):
+        return bool(self.available_selectors or self.gone_selectors or self.gone_titles or self.render)
+
+    def status(self, response, rendered=False):
+        if response.status in GONE_STATUSES:
+            return 404
+        if response.status != 200:
+            return response.status if rendered else None
+        title = response.css('title::text').get(default='') if self.needs_body or rendered else ''
+        if any(marker in title for marker in BLOCKED_TITLES):
+            return 403 if rendered else None
+        redirected = response.meta.get('redirect_urls') or response.url != response.request.url
+        if self.redirect_gone and redirected:
+            return 404
+        if any(marker in response.url for marker in self.gone_url_markers):
+            return 404
+        if any(marker in title for marker in self.gone_titles):
+            return 404
+        if any(response.css(selector) for selector in self.gone_selectors):
+            return 404
+        if self.available_selectors:
+            if any(response.css(selector) for selector in self.available_selectors):
+                return 200
+            return 404 if rendered else None
+        if self.render and not rendered:
+            return None
+        return 200
+
+
+class CheckerSpider(scrapy.Spider):
+    """Base of the product checker, which re-visits products to find the ones gone from their shop.
+
+    Requests the products that are due for a check, the ones with the
+    highest ``check_priority`` first, of every site or, when the spider gets
+    a ``site_name`` argument, of the sites whose name contains it;
+    ProductUpdatePipeline schedules the next check.  A run stops after
+    ``CLOSESPIDER_TIMEOUT`` and whatever it didn't reach stays due for the
+    next one.  The links are streamed from a database cursor in chunks of
+    ``CHECKER_CHUNK_SIZE`` while the crawl runs: Scrapy only pulls the next
+    start request when the downloader has room for it, so neither the
+    spider nor the scheduler ever hold the whole catalog.
+
+    Each product is judged by the first CheckerRule whose ``url_pattern``
+    its link contains, or by the plain HTTP status when none does.  It is
+    first fetched over HTTP, with a HEAD request when the rule doesn't need
+    the page, and only loaded in a browser when that answer is ambiguous.
+    Every rule's shop gets its own download slot limited to the rule's
+    ``concurrency`` and ``download_delay``, for its HTTP and its browser
+    requests alike.
+    """
+    site_name = None
+    default_rules = CheckRules()
+    custom_settings = {
+        'ROBOTSTXT_OBEY': False,
+        'CONCURRENT_REQUESTS': 64,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 16,
+        'CLOSESPIDER_TIMEOUT': 4 * 60 * 60,
+        'SELENIUM_DRIVER_NAME': 'firefox',
+        'SELENIUM_DRIVER_EXECUTABLE_PATH': which('geckodriver'),
+        'SELENIUM_DRIVER_ARGUMENTS': ['-headless'],
+        # 'SELENIUM_DRIVER_ARGUMENTS': [],
+        'DOWNLOADER_MIDDLEWARES': {
+            'scrapy_app.middlewares.SeleniumMiddleware': 800,
+        },
+        'ITEM_PIPELINES': {
+            'scrapy_app.pipelines.ProductUpdatePipeline': 300,
+        }
+    }
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        slots = {rule.url_pattern: {'concurrency': rule.concurrency, 'delay': rule.download_delay}
+                 for rule in CheckerRule.objects.all()}
+        settings.set('DOWNLOAD_SLOTS', slots, priority='spider')
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        return spider
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rules = [(rule.url_pattern, rule.check_rules()) for rule in CheckerRule.objects.all()]
+
+    def spider_closed(self, spider, reason):
+        mark_checked(spider.name)
+
+    def products(self):
+        products = Product.objects.filter(next_check_at__lte=timezone.now())
+        if self.site_name is not None:
+            products = products.filter(site__name__contains=self.site_name)
+        return products.order_by('-check_priority', 'next_check_at')
+
+    def start_requests(self):
+        chunk_size = self.settings.getint('CHECKER_CHUNK_SIZE', 2000)
+        links = self.products().values_list('product_link', flat=True)
+        for url in links.iterator(chunk_size=chunk_size):
+            yield self.make_request(url)
+
+    def rules_for(self, url):
+        for url_pattern, rules in self.rules:
+            if url_pattern in url:
+                return rules
+        return self.default_rules
+
+    def make_request(self, url, method=None):
+        rules = self.rules_for(url)
+        if method is None:
+            method = 'GET' if rules.needs_body else 'HEAD'
+        meta = {'product_link': url, 'handle_httpstatus_list': HTTP_CHECK_STATUSES}
+        if rules.slot is not None:
+            meta['download_slot'] = rules.slot
+        return scrapy.Request(url, method=method, callback=self.check, dont_filter=True, meta=meta)
+
+    def make_browser_request(self, url):
+        rules = self.rules_for(url)
+        meta = {'product_link': url, 'scroll': False}
+        if rules.slot is not None:
+            meta['download_slot'] = rules.slot
+        if rules.command_executor is not None:
+            meta['command_executor'] = rules.command_executor
+        return SeleniumRequest(url=url, callback=self.parse, dont_filter=True, meta=meta)
+
+    def make_item(self, product_link, status):
+        item = ProductItem()
+        item['product_link'] = product_link
+        item['status'] = status
+        return item
+
+    def check(self, response):
+        product_link = response.meta['product_link']
+        if response.request.method == 'HEAD' and response.status == 405:
+            yield self.make_request(product_link, method='GET')
+            return
+        status = self.rules_for(product_link).status(response)
+        if status is None:
+            self.crawler.stats.inc_value('checker/browser')
+            yield self.make_browser_request(product_link)
+            return
+        self.crawler.stats.inc_value('checker/http')
+        yield self.make_item(product_link, status)
+
+    def parse(self, response, **kwargs):
+        product_link = response.meta['product_link']
+        yield self.make_item(product_link, self.rules_for(product_link).status(response, rendered=True))
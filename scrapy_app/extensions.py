@@ -0,0 +1,54 @@
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+
+class ReactorStallMonitor:
+    """Measures how long the reactor thread is blocked during a crawl.
+
+    A timer is scheduled every ``REACTOR_STALL_INTERVAL`` seconds. Whatever it
+    fires late by is time the reactor spent stuck in synchronous work (image
+    decoding, database writes, ...) instead of driving downloads. Ticks later
+    than ``REACTOR_STALL_THRESHOLD`` count as stalls in the crawl stats.
+    """
+
+    def __init__(self, stats, interval, threshold):
+        self.stats = stats
+        self.interval = interval
+        self.threshold = threshold
+        self.last_tick = None
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('REACTOR_STALL_MONITOR_ENABLED'):
+            raise NotConfigured
+        extension = cls(
+            stats=crawler.stats,
+            interval=crawler.settings.getfloat('REACTOR_STALL_INTERVAL', 0.05),
+            threshold=crawler.settings.getfloat('REACTOR_STALL_THRESHOLD', 0.1),
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.last_tick = time.monotonic()
+        self.loop = task.LoopingCall(self.tick)
+        self.loop.start(self.interval, now=False)
+
+    def tick(self):
+        now = time.monotonic()
+        lag = max(now - self.last_tick - self.interval, 0)
+        self.last_tick = now
+        self.stats.inc_value('reactor/ticks')
+        self.stats.max_value('reactor/stall_max', round(lag, 4))
+        if lag > self.threshold:
+            self.stats.inc_value('reactor/stalls')
+            self.stats.inc_value('reactor/stall_time', round(lag, 4), start=0)
+
+    def spider_closed(self, spider):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
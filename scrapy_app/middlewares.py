@@ -2,8 +2,8 @@
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+import logging
 import time
-from importlib import import_module
 
 from scrapy import signals
 
@@ -12,8 +12,17 @@ from itemadapter import is_item, ItemAdapter
 from scrapy.exceptions import NotConfigured
 from scrapy.http import HtmlResponse
 from scrapy_selenium import SeleniumRequest
-from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.support.wait import WebDriverWait
+from twisted.internet import defer, task, threads
+from twisted.python.threadpool import ThreadPool
+
+from scrapy_app.webdrivers import browser_session, get_webdriver_pool, scroll_until_stable
+
+logger = logging.getLogger(__name__)
+
+# Answers of bot protection to requests it doesn't let through.
+BLOCKED_STATUSES = {401, 403, 429, 503}
 
 
 class ScrapyAppSpiderMiddleware:
@@ -110,74 +119,74 @@ class ScrapyAppDownloaderMiddleware:
         spider.logger.info('Spider opened: %s' % spider.name)
 
 
-class SeleniumMiddleware:
-    """Scrapy middleware handling the requests using selenium"""
+class BrowserSlot:
+    """Concurrency and delay of the browser requests sharing a download slot
+
+    Scrapy applies ``DOWNLOAD_SLOTS`` in the downloader, which selenium
+    requests never reach: SeleniumMiddleware answers them in
+    ``process_request``.
+    """
+
+    def __init__(self, concurrency, delay):
+        self.semaphore = defer.DeferredSemaphore(concurrency)
+        self.delay = delay
+        self.next_start = 0
+
+    def run(self, render):
+        """Call ``render`` once the slot has room and its delay has passed; returns its Deferred"""
+
+        return self.semaphore.run(self.start, render)
+
+    def start(self, render):
+        from twisted.internet import reactor
+        now = time.monotonic()
+        wait = max(0, self.next_start - now)
+        self.next_start = max(now, self.next_start) + self.delay
+        return task.deferLater(reactor, wait, render)
 
-    def __init__(self, driver_name, driver_executable_path, driver_arguments, browser_executable_path, proxy):
-        """Initialize the selenium webdriver
+
+class SeleniumMiddleware:
+    """Scrapy middleware handling the requests using selenium
+
+    Pages are rendered in a thread pool with one browser per thread, leased
+    from the crawl's WebDriverPool, so up to ``WEBDRIVER_POOL_SIZE`` pages
+    load at once and ``CONCURRENT_REQUESTS`` applies to selenium requests
+    like to any other.  The browser goes back to the pool as soon as the
+    page is read, so responses carry what callbacks need from it in
+    ``meta``: the page ``title`` and, for ``screenshot=True`` requests, the
+    ``screenshot`` PNG (of the ``screenshot_selector`` element when the
+    request's meta names one, otherwise of the whole page).  Requests with
+    ``meta={'scroll': False}`` skip scrolling the page to its end; a
+    ``scroll_selector`` is passed on to ``scroll_until_stable`` and a
+    ``close_selector`` names a popup to close before scrolling.
+
+    Selenium requests whose ``meta['download_slot']`` is configured in
+    ``DOWNLOAD_SLOTS`` also keep to that slot's ``concurrency`` and
+    ``delay``, see BrowserSlot.  Requests with a ``command_executor`` in
+    their meta are rendered by a pool of browsers on that Selenium server.
+
+    Plain HTTP requests can carry a SeleniumRequest in
+    ``meta['selenium_fallback']``; it replaces them when the site blocks
+    their response.
+    """
+
+    def __init__(self, webdriver_pool, download_slots=None):
+        """Initialize the thread pool rendering the pages
 
         Parameters
         ----------
-        driver_name: str
-            The selenium ``WebDriver`` to use
-        driver_executable_path: str
-            The path of the executable binary of the driver
-        driver_arguments: list
-            A list of arguments to initialize the driver
-        browser_executable_path: str
-            The path of the executable binary of the browser
+        webdriver_pool: WebDriverPool
+            The pool configured by the ``SELENIUM_*`` and ``WEBDRIVER_*`` settings
+        download_slots: dict
+            The ``DOWNLOAD_SLOTS`` setting
         """
 
-        webdriver_base_path = f'selenium.webdriver.{driver_name}'
-
-        driver_klass_module = import_module(f'{webdriver_base_path}.webdriver')
-        driver_klass = getattr(driver_klass_module, 'WebDriver')
-
-        driver_options_module = import_module(f'{webdriver_base_path}.options')
-        driver_options_klass = getattr(driver_options_module, 'Options')
-
-        driver_options = driver_options_klass()
-        if browser_executable_path:
-            driver_options.binary_location = browser_executable_path
-        for argument in driver_arguments:
-            driver_options.add_argument(argument)
-        if proxy:
-            if driver_name == 'chrome':
-                chrome_capabilities = webdriver.DesiredCapabilities.CHROME
-                chrome_capabilities['proxy'] = {
-                    "proxyType": "MANUAL",
-                    "httpProxy": proxy,
-                    "ftpProxy": proxy,
-                    "sslProxy": proxy
-                }
-                capabilities = chrome_capabilities
-                driver_kwargs = {
-                    'executable_path': driver_executable_path,
-                    f'{driver_name}_options': driver_options,
-                    'capabilities': capabilities
-                }
-            else:
-                firefox_capabilities = webdriver.DesiredCapabilities.FIREFOX
-                firefox_capabilities['marionette'] = True
-                firefox_capabilities['proxy'] = {
-                    "proxyType": "MANUAL",
-                    "httpProxy": proxy,
-                    "ftpProxy": proxy,
-                    "sslProxy": proxy
-                }
-                capabilities = firefox_capabilities
-                driver_kwargs = {
-                    'executable_path': driver_executable_path,
-                    f'{driver_name}_options': driver_options,
-                    'capabilities': capabilities
-                }
-        else:
-            driver_kwargs = {
-                'executable_path': driver_executable_path,
-                f'{driver_name}_options': driver_options
-            }
-
-        self.driver = driver_klass(**driver_kwargs)
+        self.webdriver_pool = webdriver_pool
+        self.thread_pool = ThreadPool(minthreads=1, maxthreads=webdriver_pool.size, name='selenium')
+        self.download_slots = download_slots or {}
+        self.slots = {}
+        self.crawler = None
+        self.remote_renderers = {}
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -185,87 +194,139 @@ class SeleniumMiddleware:
 
         driver_name = crawler.settings.get('SELENIUM_DRIVER_NAME')
         driver_executable_path = crawler.settings.get('SELENIUM_DRIVER_EXECUTABLE_PATH')
-        browser_executable_path = crawler.settings.get('SELENIUM_BROWSER_EXECUTABLE_PATH')
-        driver_arguments = crawler.settings.get('SELENIUM_DRIVER_ARGUMENTS')
-        proxy = crawler.settings.get('SELENIUM_PROXY')
+        command_executor = crawler.settings.get('SELENIUM_COMMAND_EXECUTOR')
 
-        if not driver_name or not driver_executable_path:
+        if not driver_name or not (driver_executable_path or command_executor):
             raise NotConfigured(
-                'SELENIUM_DRIVER_NAME and SELENIUM_DRIVER_EXECUTABLE_PATH must be set'
+                'SELENIUM_DRIVER_NAME and SELENIUM_DRIVER_EXECUTABLE_PATH or SELENIUM_COMMAND_EXECUTOR must be set'
             )
 
-        middleware = cls(
-            driver_name=driver_name,
-            driver_executable_path=driver_executable_path,
-            driver_arguments=driver_arguments,
-            browser_executable_path=browser_executable_path,
-            proxy=proxy
-        )
+        middleware = cls(webdriver_pool=get_webdriver_pool(crawler),
+                         download_slots=crawler.settings.getdict('DOWNLOAD_SLOTS'))
+        middleware.crawler = crawler
 
+        crawler.signals.connect(middleware.spider_opened, signals.spider_opened)
         crawler.signals.connect(middleware.spider_closed, signals.spider_closed)
 
         return middleware
 
-    def scroll(self, browser, timeout):
-        scroll_pause_time = timeout
-        position = 0
-        step = 300
-
-        time.sleep(scroll_pause_time)
-
-        while True:
-            position = position + step
-            browser.execute_script("window.scrollTo(0, {0});".format(position))
-
-            time.sleep(scroll_pause_time)
-
-            document_height = browser.execute_script("return document.body.scrollHeight")
-            if document_height < position:
-                break
-
     def process_request(self, request, spider):
         """Process a request using the selenium driver if applicable"""
 
         if not isinstance(request, SeleniumRequest):
             return None
 
-        self.driver.implicitly_wait(30)
-        self.driver.get(request.url)
-
-        self.scroll(self.driver, 3)
+        from twisted.internet import reactor
+        webdriver_pool, thread_pool = self.renderer(request)
+        slot = self.slot(request)
+        if slot is None:
+            return threads.deferToThreadPool(reactor, thread_pool, self.render, request, webdriver_pool)
+        return slot.run(lambda: threads.deferToThreadPool(reactor, thread_pool, self.render, request, webdriver_pool))
+
+    def renderer(self, request):
+        """The WebDriverPool and thread pool rendering the request"""
+
+        command_executor = request.meta.get('command_executor')
+        if command_executor is None:
+            return self.webdriver_pool, self.thread_pool
+        if command_executor not in self.remote_renderers:
+            webdriver_pool = get_webdriver_pool(self.crawler, command_executor)
+            thread_pool = ThreadPool(minthreads=1, maxthreads=webdriver_pool.size, name='selenium')
+            thread_pool.start()
+            self.remote_renderers[command_executor] = (webdriver_pool, thread_pool)
+        return self.remote_renderers[command_executor]
+
+    def slot(self, request):
+        """The BrowserSlot of the request's configured download slot, if it has one"""
+
+        key = request.meta.get('download_slot')
+        if key not in self.download_slots:
+            return None
+        if key not in self.slots:
+            config = self.download_slots[key]
+            self.slots[key] = BrowserSlot(config.get('concurrency', self.webdriver_pool.size),
+                                          config.get('delay', 0))
+        return self.slots[key]
+
+    def render(self, request, webdriver_pool):
+        """Load the request in a browser of ``webdriver_pool`` and build its response; runs in the thread pool"""
+
+        with webdriver_pool.lease() as driver:
+            driver.implicitly_wait(30)
+            driver.get(request.url)
+
+            close_selector = request.meta.get('close_selector')
+            if close_selector:
+                try:
+                    driver.find_element_by_css_selector(close_selector).click()
+                except NoSuchElementException:
+                    logger.debug('No %s to close on %s', close_selector, request.url)
+
+            if request.meta.get('scroll', True):
+                scroll_until_stable(driver, request.meta.get('scroll_selector'))
+
+            for cookie_name, cookie_value in request.cookies.items():
+                driver.add_cookie(
+                    {
+                        'name': cookie_name,
+                        'value': cookie_value
+                    }
+                )
+
+            if request.wait_until:
+                WebDriverWait(driver, request.wait_time).until(
+                    request.wait_until
+                )
+
+            if request.screenshot:
+                selector = request.meta.get('screenshot_selector')
+                if selector:
+                    request.meta['screenshot'] = driver.find_element_by_css_selector(selector).screenshot_as_png
+                else:
+                    request.meta['screenshot'] = driver.get_screenshot_as_png()
+
+            if request.script:
+                driver.execute_script(request.script)
+
+            body = str.encode(driver.page_source)
+            request.meta['title'] = driver.title
+            url = driver.current_url
+            if not request.screenshot:
+                webdriver_pool.session = browser_session(driver)
 
-        for cookie_name, cookie_value in request.cookies.items():
-            self.driver.add_cookie(
-                {
-                    'name': cookie_name,
-                    'value': cookie_value
-                }
-            )
+        return HtmlResponse(
+            url,
+            body=body,
+            encoding='utf-8',
+            request=request
+        )
 
-        if request.wait_until:
-            WebDriverWait(self.driver, request.wait_time).until(
-                request.wait_until
-            )
+    def process_response(self, request, response, spider):
+        """Retry blocked HTTP requests in a browser when they have a selenium fallback"""
 
-        if request.screenshot:
-            request.meta['screenshot'] = self.driver.get_screenshot_as_png()
+        fallback = request.meta.get('selenium_fallback')
+        if fallback is None or not self.blocked(response):
+            return response
+        spider.crawler.stats.inc_value('selenium/fallback', spider=spider)
+        return fallback
 
-        if request.script:
-            self.driver.execute_script(request.script)
+    def blocked(self, response):
+        """Whether the site refused the request or answered with a page instead of the requested image
 
-        body = str.encode(self.driver.page_source)
+        Redirects are left to RedirectMiddleware, which follows them with the fallback still in the meta.
+        """
 
-        # Expose the driver via the "meta" attribute
-        request.meta.update({'driver': self.driver})
+        if response.status in BLOCKED_STATUSES:
+            return True
+        content_type = response.headers.get('Content-Type', b'').decode('latin-1')
+        return 200 <= response.status < 300 and not content_type.startswith('image/')
 
-        return HtmlResponse(
-            self.driver.current_url,
-            body=body,
-            encoding='utf-8',
-            request=request
-        )
+    def spider_opened(self, spider):
+        self.thread_pool.start()
 
     def spider_closed(self):
-        """Shutdown the driver when spider is closed"""
+        """Stop the rendering threads when spider is closed; the pools quit the browsers"""
 
-        self.driver.quit()
+        self.thread_pool.stop()
+        for webdriver_pool, thread_pool in self.remote_renderers.values():
+            thread_pool.stop()
@@ -5,112 +5,374 @@
 
 
 # useful for handling different item types with a single interface
+import hashlib
 import logging
-from io import BytesIO
+from collections import defaultdict
+from datetime import timedelta
 
-from PIL import Image
+from django.db import DatabaseError, transaction
+from django.db.models import Count
+from django.utils import timezone
 from itemadapter import ItemAdapter
-from scrapy.pipelines.images import ImagesPipeline, ImageException
+from scrapy import Request
+from scrapy.pipelines.files import FileException
+from scrapy.pipelines.images import ImagesPipeline
 from scrapy_selenium import SeleniumRequest
+from twisted.internet import defer, task, threads
+from twisted.python.threadpool import ThreadPool
 
-from backend.models import Site, Product
+from backend.caches import expire_feeds
+from backend.models import CHECK_INTERVALS, Product, check_priority
+from scraping.sites import get_site
+from scrapy_app.webdrivers import get_webdriver_pool
+
+logger = logging.getLogger(__name__)
 
 
 class ProductPipeline:
+    """Buffers scraped products and writes them with one upsert per batch.
+
+    Rows are keyed on ``product_link``: new links are inserted, known ones get
+    the fresh price, images and site.  Products whose ``content_hash`` matches
+    the stored one are not written at all.  The buffer is flushed once it
+    holds ``PRODUCT_BATCH_SIZE`` products, every ``PRODUCT_BATCH_INTERVAL``
+    seconds and when the spider closes.  A batch the database rejects is
+    retried one product at a time; products that still fail are logged,
+    counted in ``products/failed`` and written again when next scraped.
+    """
+    update_fields = ['price', 'sale_price', 'image_filename', 'hq_image_filename', 'site',
+                     'site_name', 'site_display_name', 'site_gender', 'site_type', 'content_hash', 'updated_at']
+
+    def __init__(self, stats, batch_size, batch_interval):
+        self.stats = stats
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.site = None
+        self.content_hashes = {}
+        self.buffer = {}
+        self.flush_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            stats=crawler.stats,
+            batch_size=crawler.settings.getint('PRODUCT_BATCH_SIZE', 200),
+            batch_interval=crawler.settings.getfloat('PRODUCT_BATCH_INTERVAL', 10),
+        )
+
+    def open_spider(self, spider):
+        self.site = get_site(spider.name)
+        if self.site is None:
+            print("{} does not exist".format(spider.name))
+        else:
+            products = Product.objects.filter(site=self.site).values_list('product_link', 'content_hash')
+            self.content_hashes = dict(products.iterator())
+        self.flush_loop = task.LoopingCall(self.flush, spider)
+        self.flush_loop.start(self.batch_interval, now=False)
+
     def process_item(self, item, spider):
+        if self.site is None:
+            return item
         adapter = ItemAdapter(item)
-        site_name_gender_type = spider.name
-        site_keys = site_name_gender_type.split('_')
-        site_name = site_keys[0]
-        site_gender = site_keys[1]
-        site_type = site_keys[2]
-        try:
-            site = Site.objects.get(name=site_name, gender=site_gender, type=site_type)
-            title = adapter.get('title')
-            price = adapter.get('price')
-            sale_price = adapter.get('sale_price')
-            images = adapter.get('images')
-            image_filename = None
+        images = adapter.get('images')
+        image_filename = None
+        hq_image_filename = None
+        if len(images) == 1:
+            image_filename = images[0].get('path')
             hq_image_filename = None
-            if len(images) == 1:
-                image_filename = images[0].get('path')
-                hq_image_filename = None
-            elif len(images) == 2:
-                image_filename = images[0].get('path')
-                hq_image_filename = images[1].get('path')
-            product_link = adapter.get('product_link')
-            try:
-                product = Product.objects.get(site=site, product_link=product_link)
-                product.price = price
-                product.sale_price = sale_price
-                product.image_filename = image_filename
-                product.hq_image_filename = hq_image_filename
-                product.product_link = product_link
-                product.save()
-                print("Product: {} updated.".format(title))
-            except Product.DoesNotExist:
-                Product.objects.create(
-                    title=title,
-                    price=price, sale_price=sale_price,
-                    image_filename=image_filename, hq_image_filename=hq_image_filename,
-                    product_link=product_link, site=site
-                )
-                print("Product: {} added.".format(title))
-            except Product.MultipleObjectsReturned:
-                products = Product.objects.filter(site=site, product_link=product_link)
-                products.delete()
-                print("Multiple object returned and deleted.")
-                Product.objects.create(
-                    title=title,
-                    price=price, sale_price=sale_price,
-                    image_filename=image_filename, hq_image_filename=hq_image_filename,
-                    product_link=product_link, site=site
-                )
-                print("Product: {} added.".format(title))
-        except Site.DoesNotExist:
-            print("{} does not exist".format(site_name_gender_type))
+        elif len(images) == 2:
+            image_filename = images[0].get('path')
+            hq_image_filename = images[1].get('path')
+        product_link = adapter.get('product_link')
+        product = Product(
+            title=adapter.get('title'),
+            price=adapter.get('price'), sale_price=adapter.get('sale_price'),
+            image_filename=image_filename, hq_image_filename=hq_image_filename,
+            product_link=product_link, site=self.site, **self.site.product_fields()
+        )
+        product.content_hash = product.compute_content_hash()
+        if product_link not in self.content_hashes:
+            self.stats.inc_value('products/added', spider=spider)
+        elif self.content_hashes[product_link] != product.content_hash:
+            self.stats.inc_value('products/updated', spider=spider)
+        else:
+            self.stats.inc_value('products/unchanged', spider=spider)
+            return item
+        self.content_hashes[product_link] = product.content_hash
+        # Keyed by link: one upsert can't touch the same row twice.
+        self.buffer[product_link] = product
+        if len(self.buffer) >= self.batch_size:
+            self.flush(spider)
         return item
 
+    def flush(self, spider):
+        if not self.buffer:
+            return
+        products = list(self.buffer.values())
+        self.buffer = {}
+        try:
+            self.save(products)
+        except DatabaseError:
+            logger.warning('Could not save %d products together, saving them one at a time', len(products),
+                           exc_info=True)
+            saved = 0
+            for product in products:
+                try:
+                    self.save([product])
+                except DatabaseError:
+                    # Forget the hash so the product is written again the next time it is scraped.
+                    self.content_hashes.pop(product.product_link, None)
+                    self.stats.inc_value('products/failed', spider=spider)
+                    logger.exception('Could not save product %s', product.product_link)
+                else:
+                    saved += 1
+            logger.info('%d products saved', saved)
+        else:
+            logger.info('%d products saved', len(products))
+
+    def save(self, products):
+        Product.objects.bulk_create(products, batch_size=self.batch_size, update_conflicts=True,
+                                    unique_fields=['product_link'], update_fields=self.update_fields)
+
+    def close_spider(self, spider):
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush(spider)
+        if self.stats.get_value('products/added', 0, spider=spider) or \
+                self.stats.get_value('products/updated', 0, spider=spider):
+            expire_feeds()
+
 
 class ProductUpdatePipeline:
+    """Buffers checker results and applies them in batches.
+
+    Each flush deletes the 404s together, in one transaction with the
+    updates; their image files are removed in the background after the
+    commit.  The other products get their status and their next check
+    scheduled by ``check_priority``, with one UPDATE per status and
+    priority.  Like ProductPipeline, it flushes every ``PRODUCT_BATCH_SIZE``
+    results, every ``PRODUCT_BATCH_INTERVAL`` seconds and when the spider
+    closes, and retries a batch the database rejects one result at a time.
+    """
+
+    def __init__(self, stats, batch_size, batch_interval):
+        self.stats = stats
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.statuses = {}
+        self.flush_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            stats=crawler.stats,
+            batch_size=crawler.settings.getint('PRODUCT_BATCH_SIZE', 200),
+            batch_interval=crawler.settings.getfloat('PRODUCT_BATCH_INTERVAL', 10),
+        )
+
+    def open_spider(self, spider):
+        self.flush_loop = task.LoopingCall(self.flush, spider)
+        self.flush_loop.start(self.batch_interval, now=False)
+
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
-        product_link = adapter.get('product_link')
-        status = adapter.get('status')
-        try:
-            products = Product.objects.filter(product_link=product_link)
-            if status == 404:
-                products.delete()
-            else:
-                for product in products:
-                    product.status = status
-                    product.save()
-        except Product.DoesNotExist:
-            logger = logging.getLogger(__name__)
-            logger.warning("Product doesn't exist: {}".format(product_link))
+        self.statuses[adapter.get('product_link')] = adapter.get('status')
+        if len(self.statuses) >= self.batch_size:
+            self.flush(spider)
         return item
 
+    def flush(self, spider):
+        if not self.statuses:
+            return
+        statuses = self.statuses
+        self.statuses = {}
+        try:
+            self.apply(statuses, spider)
+        except DatabaseError:
+            logger.warning('Could not apply %d checker results together, applying them one at a time',
+                           len(statuses), exc_info=True)
+            for product_link, status in statuses.items():
+                try:
+                    self.apply({product_link: status}, spider)
+                except DatabaseError:
+                    self.stats.inc_value('products/failed', spider=spider)
+                    logger.exception('Could not apply status %s to product %s', status, product_link)
+
+    def apply(self, statuses, spider):
+        links_by_status = defaultdict(list)
+        for product_link, status in statuses.items():
+            links_by_status[status].append(product_link)
+        deleted = checked = 0
+        with transaction.atomic():
+            for status, product_links in links_by_status.items():
+                products = Product.objects.filter(product_link__in=product_links)
+                if status == 404:
+                    deleted += products.delete()[1].get(Product._meta.label, 0)
+                else:
+                    checked += self.schedule(products, status)
+        # Counted once committed, so a rolled back batch isn't counted twice when retried.
+        self.stats.inc_value('products/deleted', deleted, spider=spider)
+        self.stats.inc_value('products/checked', checked, spider=spider)
+
+    def schedule(self, products, status):
+        now = timezone.now()
+        products = products.annotate(loves=Count('productlove', distinct=True),
+                                     saves=Count('boardproduct', distinct=True))
+        ids_by_priority = defaultdict(list)
+        for pk, inserted_at, loves, saves in products.values_list('pk', 'inserted_at', 'loves', 'saves'):
+            ids_by_priority[check_priority(now - inserted_at, loves + saves, status)].append(pk)
+        updated = 0
+        for priority, ids in ids_by_priority.items():
+            updated += Product.objects.filter(pk__in=ids).update(
+                status=status, last_checked_at=now, updated_at=now, check_priority=priority,
+                next_check_at=now + timedelta(days=CHECK_INTERVALS[priority]),
+            )
+        return updated
+
+    def close_spider(self, spider):
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush(spider)
+        expire_feeds()
+
+
+class PooledImagesPipeline(ImagesPipeline):
+    """ImagesPipeline that decodes, checks, re-encodes and stores images in a thread pool.
+
+    Pillow releases the GIL while it works, so up to ``IMAGES_THREADS``
+    images are processed in parallel and the reactor keeps downloading
+    meanwhile.  ``IMAGES_THREADS = 0`` processes them on the reactor thread.
+    """
+    image_pool = None
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        threads = self.crawler.settings.getint('IMAGES_THREADS', 4)
+        if threads > 0:
+            self.image_pool = ThreadPool(minthreads=1, maxthreads=threads, name='images')
+            self.image_pool.start()
+
+    def close_spider(self, spider):
+        if self.image_pool is not None:
+            self.image_pool.stop()
+            self.image_pool = None
+
+    def file_downloaded(self, response, request, info, *, item=None):
+        if self.image_pool is None:
+            return self.process_images(response, request, info, item)
+        from twisted.internet import reactor
+        return threads.deferToThreadPool(reactor, self.image_pool, self.process_images, response, request, info, item)
+
+    def media_downloaded(self, response, request, info, *, item=None):
+        result = super().media_downloaded(response, request, info, item=item)
+        # Scrapy < 2.15 doesn't wait for file_downloaded and takes the Deferred for the checksum;
+        # wait for the pool here so the item completes with the stored image or its error.
+        if isinstance(result, dict) and isinstance(result.get('checksum'), defer.Deferred):
+            checksum = result['checksum']
+            checksum.addCallback(lambda value: dict(result, checksum=value))
+            checksum.addErrback(self.image_failed, request, info)
+            return checksum
+        return result
+
+    def image_failed(self, failure, request, info):
+        if failure.check(FileException):
+            logger.warning('File (error): Error processing file from %(request)s: %(errormsg)s',
+                           {'request': request, 'errormsg': str(failure.value)}, extra={'spider': info.spider})
+            return failure
+        logger.error('File (unknown-error): Error processing file from %(request)s', {'request': request},
+                     exc_info=(failure.type, failure.value, failure.getTracebackObject()),
+                     extra={'spider': info.spider})
+        raise FileException(str(failure.value))
+
+    def process_images(self, response, request, info, item):
+        checksum = None
+        for path, image, buf in self.get_images(response, request, info, item=item):
+            if checksum is None:
+                checksum = hashlib.md5(buf.getvalue()).hexdigest()
+            width, height = image.size
+            self.store.persist_file(path, buf, info, meta={'width': width, 'height': height},
+                                    headers={'Content-Type': 'image/jpeg'})
+        return checksum
+
+
+class KnownImagesPipeline(PooledImagesPipeline):
+    """ImagesPipeline that doesn't fetch images of products it already stored.
+
+    Images are saved as ``full/<sha1 of url>.jpg``, so when a known product's
+    stored filenames equal the paths of the scraped URLs the images haven't
+    changed.  Such items skip the download and get the stored paths as their
+    ``images`` result.  Subclasses build the requests of the other items in
+    ``download_requests``.
+    """
+    known_images = None
+
+    def stored_images(self, item, info):
+        if self.known_images is None:
+            self.known_images = {}
+            site = get_site(info.spider.name)
+            if site is not None:
+                products = Product.objects.filter(site=site).values_list('product_link', 'image_filename',
+                                                                         'hq_image_filename')
+                self.known_images = {link: [image, hq_image] for link, image, hq_image in products.iterator()}
+        adapter = ItemAdapter(item)
+        stored = self.known_images.get(adapter.get('product_link'))
+        image_urls = adapter.get('image_urls') or []
+        if stored is None or len(image_urls) not in (1, 2):
+            return None
+        paths = [self.file_path(Request(url)) for url in image_urls]
+        if paths + [None] * (2 - len(paths)) != stored:
+            return None
+        return [{'url': url, 'path': path, 'checksum': None} for url, path in zip(image_urls, paths)]
 
-class ImagesWithSeleniumProxyPipeline(ImagesPipeline):
     def get_media_requests(self, item, info):
+        if self.stored_images(item, info) is not None:
+            info.spider.crawler.stats.inc_value('images/known', spider=info.spider)
+            return []
+        return self.download_requests(item, info)
+
+    def download_requests(self, item, info):
+        return super().get_media_requests(item, info)
+
+    def item_completed(self, results, item, info):
+        images = self.stored_images(item, info)
+        if images is not None:
+            ItemAdapter(item)[self.images_result_field] = images
+            return item
+        return super().item_completed(results, item, info)
+
+
+class ImagesWithSeleniumProxyPipeline(KnownImagesPipeline):
+    """Images of sites that only serve them to a browser.
+
+    With ``SELENIUM_IMAGES_HTTP`` the images are downloaded over HTTP with
+    the cookies and User-Agent of the browser that rendered the product
+    list, and only screenshot in a browser when the site blocks that
+    request.  Otherwise every image is loaded in a browser and stored from
+    a screenshot of its ``img`` element.
+    """
+
+    def download_requests(self, item, info):
+        session = None
+        if self.crawler.settings.getbool('SELENIUM_IMAGES_HTTP'):
+            session = get_webdriver_pool(self.crawler).session
+        requests = []
         for image_url in item['image_urls']:
-            yield SeleniumRequest(url=image_url)
-
-    def get_images(self, response, request, info, **kwargs):
-        driver = response.meta['driver']
-        image_src = driver.find_element_by_tag_name('img')
-        path = self.file_path(request, response=response, info=info)
-        orig_image = Image.open(BytesIO(image_src.screenshot_as_png))
-
-        width, height = orig_image.size
-        if width < self.min_width or height < self.min_height:
-            raise ImageException("Image too small (%dx%d < %dx%d)" %
-                                 (width, height, self.min_width, self.min_height))
-
-        image, buf = self.convert_image(orig_image)
-        yield path, image, buf
-
-        for thumb_id, size in self.thumbs.items():
-            thumb_path = self.thumb_path(request, thumb_id, response=response.meta['screenshot'], info=info)
-            thumb_image, thumb_buf = self.convert_image(image, size)
-            yield thumb_path, thumb_image, thumb_buf
+            screenshot_request = SeleniumRequest(url=image_url, screenshot=True, dont_filter=True,
+                                                 meta={'screenshot_selector': 'img', 'scroll': False})
+            if session is None:
+                requests.append(screenshot_request)
+            else:
+                requests.append(Request(
+                    image_url,
+                    cookies=session['cookies'],
+                    headers={'User-Agent': session['user_agent'], 'Referer': session['url'],
+                             'Accept': 'image/avif,image/webp,image/*,*/*;q=0.8'},
+                    meta={'selenium_fallback': screenshot_request},
+                ))
+        return requests
+
+    def file_downloaded(self, response, request, info, *, item=None):
+        if 'screenshot' in response.meta:
+            # SeleniumMiddleware took a screenshot of the image element while it had the page open.
+            response = response.replace(body=response.meta['screenshot'])
+        return super().file_downloaded(response, request, info, item=item)
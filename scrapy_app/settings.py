@@ -59,14 +59,41 @@ ROBOTSTXT_OBEY = True
 # EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
 # }
+EXTENSIONS = {
+    'scrapy_app.extensions.ReactorStallMonitor': 500,
+}
+
+# Browsers are shared through scrapy_app.webdrivers.WebDriverPool: at most WEBDRIVER_POOL_SIZE per crawl,
+# each replaced after WEBDRIVER_MAX_USES pages.
+WEBDRIVER_POOL_SIZE = 2
+WEBDRIVER_MAX_USES = 50
+
+# Record in the crawl stats how often and for how long the reactor thread is blocked.
+REACTOR_STALL_MONITOR_ENABLED = True
+REACTOR_STALL_INTERVAL = 0.05
+REACTOR_STALL_THRESHOLD = 0.1
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
     'scrapy_app.pipelines.ProductPipeline': 300,
-    'scrapy.pipelines.images.ImagesPipeline': 1,
+    'scrapy_app.pipelines.KnownImagesPipeline': 1,
 }
 
+# ProductPipeline writes products in batches of this size, at least every PRODUCT_BATCH_INTERVAL seconds.
+PRODUCT_BATCH_SIZE = 200
+PRODUCT_BATCH_INTERVAL = 10
+
+# Product checkers read the links to check from the database in chunks of this size.
+CHECKER_CHUNK_SIZE = 2000
+
+# Images are decoded, re-encoded and stored by this many threads; 0 keeps that work on the reactor thread.
+IMAGES_THREADS = 4
+
+# ImagesWithSeleniumProxyPipeline downloads images over HTTP with the browser's cookies and User-Agent,
+# taking screenshots in a browser only when the site blocks those requests.
+SELENIUM_IMAGES_HTTP = True
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 # AUTOTHROTTLE_ENABLED = True
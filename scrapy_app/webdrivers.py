@@ -0,0 +1,254 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from importlib import import_module
+
+from scrapy import signals
+from scrapy.settings import Settings
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger(__name__)
+
+# Height of the page, bottom of the viewport, number of loaded items and milliseconds since the
+# last network request finished.  The first call installs a PerformanceObserver for the latter.
+PAGE_STATE_SCRIPT = """
+if (!window.__lazyLoadWatch) {
+    window.__lazyLoadWatch = {lastResource: performance.now()};
+    new PerformanceObserver(function () {
+        window.__lazyLoadWatch.lastResource = performance.now();
+    }).observe({type: 'resource', buffered: true});
+}
+var selector = arguments[0];
+return [
+    document.body.scrollHeight,
+    window.pageYOffset + window.innerHeight,
+    selector ? document.querySelectorAll(selector).length : 0,
+    performance.now() - window.__lazyLoadWatch.lastResource
+];
+"""
+
+
+def scroll_until_stable(driver, item_selector=None, settle=1.5, idle=0.5, max_idle_wait=3, poll=0.2, timeout=180):
+    """Scroll a lazy-loading page to its end and return once it stops growing.
+
+    The page is scrolled a full viewport at a time, so every lazy image gets
+    into view.  After a jump it only waits until the network has been quiet
+    for ``idle`` seconds (at most ``max_idle_wait``, for pages that never go
+    quiet).  At the bottom it waits until the scroll height and the number
+    of ``item_selector`` matches have not changed for ``settle`` seconds.
+    Returns that number of matches.
+    """
+    started = time.monotonic()
+    waiting_since = started
+    stable_since = None
+    last_state = None
+    count = 0
+    while time.monotonic() - started < timeout:
+        height, bottom, count, quiet_ms = driver.execute_script(PAGE_STATE_SCRIPT, item_selector)
+        now = time.monotonic()
+        if quiet_ms < idle * 1000 and now - waiting_since < max_idle_wait:
+            time.sleep(poll)
+            continue
+        if bottom < height - 1:
+            driver.execute_script("window.scrollBy(0, window.innerHeight);")
+            # Give the page a moment to notice the new viewport before looking again.
+            time.sleep(poll)
+            waiting_since = time.monotonic()
+            stable_since = None
+            last_state = None
+            continue
+        if (height, count) != last_state:
+            last_state = (height, count)
+            stable_since = now
+        elif now - stable_since >= settle:
+            break
+        time.sleep(poll)
+    return count
+
+
+def browser_session(driver):
+    """URL, cookies and User-Agent of the page open in the driver, for HTTP requests made on its behalf."""
+    return {
+        'url': driver.current_url,
+        'cookies': [{key: cookie[key] for key in ('name', 'value', 'domain', 'path') if key in cookie}
+                    for cookie in driver.get_cookies()],
+        'user_agent': driver.execute_script("return navigator.userAgent;"),
+    }
+
+
+def make_driver_factory(settings):
+    """Function starting a new browser configured by the ``SELENIUM_*`` settings.
+
+    Without settings it starts a headless Firefox, like the spiders used to.
+    With ``SELENIUM_COMMAND_EXECUTOR`` the browser runs on that remote
+    Selenium server instead.
+    """
+    driver_name = settings.get('SELENIUM_DRIVER_NAME') or 'firefox'
+    driver_executable_path = settings.get('SELENIUM_DRIVER_EXECUTABLE_PATH')
+    browser_executable_path = settings.get('SELENIUM_BROWSER_EXECUTABLE_PATH')
+    driver_arguments = settings.get('SELENIUM_DRIVER_ARGUMENTS')
+    if driver_arguments is None:
+        driver_arguments = ['-headless']
+    proxy = settings.get('SELENIUM_PROXY')
+    command_executor = settings.get('SELENIUM_COMMAND_EXECUTOR')
+
+    webdriver_base_path = f'selenium.webdriver.{driver_name}'
+
+    driver_klass_module = import_module(f'{webdriver_base_path}.webdriver')
+    driver_klass = getattr(driver_klass_module, 'WebDriver')
+
+    driver_options_module = import_module(f'{webdriver_base_path}.options')
+    driver_options_klass = getattr(driver_options_module, 'Options')
+
+    def make_driver():
+        driver_options = driver_options_klass()
+        if browser_executable_path:
+            driver_options.binary_location = browser_executable_path
+        for argument in driver_arguments:
+            driver_options.add_argument(argument)
+        if command_executor:
+            return webdriver.Remote(command_executor=command_executor,
+                                    desired_capabilities=driver_options.to_capabilities())
+        driver_kwargs = {f'{driver_name}_options': driver_options}
+        if driver_executable_path:
+            driver_kwargs['executable_path'] = driver_executable_path
+        if proxy:
+            if driver_name == 'chrome':
+                capabilities = webdriver.DesiredCapabilities.CHROME.copy()
+            else:
+                capabilities = webdriver.DesiredCapabilities.FIREFOX.copy()
+                capabilities['marionette'] = True
+            capabilities['proxy'] = {
+                "proxyType": "MANUAL",
+                "httpProxy": proxy,
+                "ftpProxy": proxy,
+                "sslProxy": proxy
+            }
+            driver_kwargs['capabilities'] = capabilities
+        return driver_klass(**driver_kwargs)
+
+    return make_driver
+
+
+class WebDriverPool:
+    """Size-limited pool of warm browsers.
+
+    ``lease()`` hands out an idle browser, starting one while fewer than
+    ``size`` exist and otherwise waiting for one to come back.  Returned
+    browsers get their cookies, storage and page cleared, and are quit after
+    ``max_uses`` leases or when they broke during one.  Safe to use from
+    several threads.  ``session`` holds the ``browser_session`` of the last
+    page SeleniumMiddleware rendered.
+    """
+
+    def __init__(self, make_driver, size, max_uses):
+        self.make_driver = make_driver
+        self.size = size
+        self.max_uses = max_uses
+        self.idle = []
+        self.uses = {}
+        self.started = 0
+        self.closed = False
+        self.session = None
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while not self.idle and self.started >= self.size and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                raise RuntimeError('WebDriver pool is closed')
+            if self.idle:
+                return self.idle.pop()
+            self.started += 1
+        try:
+            driver = self.make_driver()
+        except Exception:
+            with self.condition:
+                self.started -= 1
+                self.condition.notify()
+            raise
+        self.uses[id(driver)] = 0
+        return driver
+
+    def release(self, driver, broken=False):
+        self.uses[id(driver)] += 1
+        keep = not broken and not self.closed and self.uses[id(driver)] < self.max_uses
+        if keep:
+            try:
+                self.reset(driver)
+            except WebDriverException:
+                keep = False
+        if not keep:
+            self.quit(driver)
+        with self.condition:
+            if keep:
+                self.idle.append(driver)
+            else:
+                self.started -= 1
+            self.condition.notify()
+
+    @contextmanager
+    def lease(self):
+        driver = self.acquire()
+        try:
+            yield driver
+        except WebDriverException:
+            self.release(driver, broken=True)
+            raise
+        except BaseException:
+            self.release(driver)
+            raise
+        else:
+            self.release(driver)
+
+    def reset(self, driver):
+        driver.delete_all_cookies()
+        try:
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        except WebDriverException:
+            # Pages like about:blank have no storage to clear.
+            pass
+        driver.get('about:blank')
+
+    def quit(self, driver):
+        self.uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except WebDriverException:
+            logger.warning('Could not quit a browser', exc_info=True)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.started -= len(idle)
+            self.condition.notify_all()
+        for driver in idle:
+            self.quit(driver)
+
+
+def get_webdriver_pool(crawler, command_executor=None):
+    """The crawl's WebDriverPool, created on first use and closed with the spider.
+
+    Sized by ``WEBDRIVER_POOL_SIZE``; browsers are replaced after ``WEBDRIVER_MAX_USES`` leases.  With a
+    ``command_executor`` the pool's browsers run on that Selenium server instead of the configured ones.
+    """
+    pools = getattr(crawler, 'webdriver_pools', None)
+    if pools is None:
+        pools = crawler.webdriver_pools = {}
+    pool = pools.get(command_executor)
+    if pool is None:
+        settings = crawler.settings
+        if command_executor is not None:
+            settings = Settings(dict(settings.copy_to_dict(), SELENIUM_COMMAND_EXECUTOR=command_executor))
+        pool = WebDriverPool(
+            make_driver_factory(settings),
+            size=crawler.settings.getint('WEBDRIVER_POOL_SIZE', 2),
+            max_uses=crawler.settings.getint('WEBDRIVER_MAX_USES', 50),
+        )
+        pools[command_executor] = pool
+        crawler.signals.connect(pool.close, signal=signals.engine_stopped, weak=False)
+    return pool
@@ -1,11 +1,10 @@
 from shutil import which
 
 import scrapy
-from django.utils import timezone
 from scrapy import signals
 from scrapy_selenium import SeleniumRequest
 
-from scraping.models import Scraper
+from scraping.sites import mark_scraped
 from scrapy_app.items import ProductItem
 
 
@@ -39,13 +38,7 @@ class ProductSpider(scrapy.Spider):
         return spider
 
     def spider_closed(self, spider, reason):
-        a = spider.name.split('_')
-        try:
-            scraper = Scraper.objects.get(site__name=a[0], site__gender=int(a[1]), site__type=int(a[2]))
-            scraper.last_scraped = timezone.now()
-            scraper.save()
-        except Scraper.DoesNotExist:
-            pass
+        mark_scraped(spider.name)
 
     def start_requests(self):
         for url in self.start_urls:
@@ -1,13 +1,10 @@
-import time
+from shutil import which
 
 import scrapy
-from django.utils import timezone
-from parsel import Selector
 from scrapy import signals
-from selenium import webdriver
-from selenium.webdriver.firefox.options import Options
+from scrapy_selenium import SeleniumRequest
 
-from scraping.models import Scraper
+from scraping.sites import mark_scraped
 from scrapy_app.items import ProductItem
 
 
@@ -17,6 +14,14 @@ class ProductSpider(scrapy.Spider):
     start_urls = [
         'https://www.pullandbear.com/us/man/new-c1030017537.html'
     ]
+    custom_settings = {
+        'SELENIUM_DRIVER_NAME': 'firefox',
+        'SELENIUM_DRIVER_EXECUTABLE_PATH': which('geckodriver'),
+        'SELENIUM_DRIVER_ARGUMENTS': ['-headless'],
+        'DOWNLOADER_MIDDLEWARES': {
+            'scrapy_app.middlewares.SeleniumMiddleware': 800,
+        },
+    }
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
@@ -25,44 +30,14 @@ class ProductSpider(scrapy.Spider):
         return spider
 
     def spider_closed(self, spider, reason):
-        a = spider.name.split('_')
-        try:
-            scraper = Scraper.objects.get(site__name=a[0], site__gender=int(a[1]), site__type=int(a[2]))
-            scraper.last_scraped = timezone.now()
-            scraper.save()
-        except Scraper.DoesNotExist:
-            pass
+        mark_scraped(spider.name)
 
-    def scroll(self, browser, timeout):
-        scroll_pause_time = timeout
-        position = 0
-        step = 1000
-
-        time.sleep(scroll_pause_time)
-
-        while True:
-            position = position + step
-            browser.execute_script("window.scrollTo(0, {0});".format(position))
-
-            time.sleep(scroll_pause_time)
-
-            document_height = browser.execute_script("return document.body.scrollHeight")
-            if document_height < position:
-                break
+    def start_requests(self):
+        for url in self.start_urls:
+            yield SeleniumRequest(url=url, meta={'scroll_selector': '.c-tile--product'})
 
     def parse(self, response, **kwargs):
-        options = Options()
-        options.headless = True
-        browser = webdriver.Firefox(options=options)
-        # browser = webdriver.Firefox()
-        browser.implicitly_wait(30)
-        browser.get(response.url)
-        time.sleep(30)
-
-        self.scroll(browser, 10)
-
-        scrapy_selector = Selector(text=browser.page_source)
-        products = scrapy_selector.css('.c-tile--product')
+        products = response.css('.c-tile--product')
         for product in products:
             item = ProductItem()
             item['title'] = product.css('.name::text').get().strip()
@@ -76,4 +51,3 @@ class ProductSpider(scrapy.Spider):
                 continue
             item['product_link'] = product.css('a::attr(href)').get()
             yield item
-        browser.close()
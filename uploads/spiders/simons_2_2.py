@@ -1,11 +1,10 @@
 from shutil import which
 
 import scrapy
-from django.utils import timezone
 from scrapy import signals
 from scrapy_selenium import SeleniumRequest
 
-from scraping.models import Scraper
+from scraping.sites import mark_scraped
 from scrapy_app.items import ProductItem
 
 
@@ -21,7 +20,7 @@ class ProductSpider(scrapy.Spider):
         'SELENIUM_DRIVER_EXECUTABLE_PATH': which('geckodriver'),
         'SELENIUM_DRIVER_ARGUMENTS': ['-headless'],
         'DOWNLOADER_MIDDLEWARES': {
-            'scrapy_selenium.SeleniumMiddleware': 800,
+            'scrapy_app.middlewares.SeleniumMiddleware': 800,
         },
         'ITEM_PIPELINES': {
             'scrapy_app.pipelines.ProductPipeline': 300,
@@ -36,17 +35,11 @@ class ProductSpider(scrapy.Spider):
         return spider
 
     def spider_closed(self, spider, reason):
-        a = spider.name.split('_')
-        try:
-            scraper = Scraper.objects.get(site__name=a[0], site__gender=int(a[1]), site__type=int(a[2]))
-            scraper.last_scraped = timezone.now()
-            scraper.save()
-        except Scraper.DoesNotExist:
-            pass
+        mark_scraped(spider.name)
 
     def start_requests(self):
         for url in self.start_urls:
-            yield SeleniumRequest(url=url)
+            yield SeleniumRequest(url=url, meta={'scroll': False})
 
     def parse(self, response, **kwargs):
         products = response.css('div.product_card')
@@ -1,5 +1,3 @@
-import time
-
 import scrapy
 import urllib.parse
 
@@ -12,6 +10,7 @@ from selenium.webdriver.firefox.options import Options
 
 from scraping.models import Scraper
 from scrapy_app.items import ProductItem
+from scrapy_app.webdrivers import scroll_until_stable
 
 
 class ProductSpider(scrapy.Spider):
@@ -37,23 +36,6 @@ class ProductSpider(scrapy.Spider):
         # except Scraper.DoesNotExist:
         #     pass
 
-    def scroll(self, browser, timeout):
-        scroll_pause_time = timeout
-        position = 0
-        step = 1000
-
-        time.sleep(scroll_pause_time)
-
-        while True:
-            position = position + step
-            browser.execute_script("window.scrollTo(0, {0});".format(position))
-
-            time.sleep(scroll_pause_time)
-
-            document_height = browser.execute_script("return document.body.scrollHeight")
-            if document_height < position:
-                break
-
     def parse(self, response, **kwargs):
         options = Options()
         options.headless = True
@@ -72,9 +54,7 @@ class ProductSpider(scrapy.Spider):
         #     time.sleep(3)
         # except NoSuchElementException:
         #     print('No close button')
-
-        self.scroll(browser, 3)
-
+        scroll_until_stable(browser, 'div.producttile-wrapper')
         scrapy_selector = Selector(text=browser.page_source)
 
         products = scrapy_selector.css('div.producttile-wrapper')
@@ -1,14 +1,10 @@
-import time
+from shutil import which
 
 import scrapy
-from django.utils import timezone
-from parsel import Selector
 from scrapy import signals
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.firefox.options import Options
+from scrapy_selenium import SeleniumRequest
 
-from scraping.models import Scraper
+from scraping.sites import mark_scraped
 from scrapy_app.items import ProductItem
 
 
@@ -18,6 +14,14 @@ class ProductSpider(scrapy.Spider):
     start_urls = [
         'https://www.zara.com/ca/en/woman-new-in-l1180.html?v1=1549286',
     ]
+    custom_settings = {
+        'SELENIUM_DRIVER_NAME': 'firefox',
+        'SELENIUM_DRIVER_EXECUTABLE_PATH': which('geckodriver'),
+        'SELENIUM_DRIVER_ARGUMENTS': ['-headless'],
+        'DOWNLOADER_MIDDLEWARES': {
+            'scrapy_app.middlewares.SeleniumMiddleware': 800,
+        },
+    }
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
@@ -26,45 +30,14 @@ class ProductSpider(scrapy.Spider):
         return spider
 
     def spider_closed(self, spider, reason):
-        a = spider.name.split('_')
-        try:
-            scraper = Scraper.objects.get(site__name=a[0], site__gender=int(a[1]), site__type=int(a[2]))
-            scraper.last_scraped = timezone.now()
-            scraper.save()
-        except Scraper.DoesNotExist:
-            pass
+        mark_scraped(spider.name)
 
-    def scroll(self, browser, timeout):
-        scroll_pause_time = timeout
-        position = 0
-        step = 1000
-
-        time.sleep(scroll_pause_time)
-
-        while True:
-            position = position + step
-            browser.execute_script("window.scrollTo(0, {0});".format(position))
-
-            time.sleep(scroll_pause_time)
-
-            document_height = browser.execute_script("return document.body.scrollHeight")
-            if document_height < position:
-                break
+    def start_requests(self):
+        for url in self.start_urls:
+            yield SeleniumRequest(url=url, meta={'scroll_selector': '.product', 'close_selector': '.modal__close-button'})
 
     def parse(self, response, **kwargs):
-        options = Options()
-        options.headless = True
-        browser = webdriver.Firefox(options=options)
-        browser.implicitly_wait(30)
-        browser.get(response.url)
-        try:
-            browser.find_element_by_css_selector('.modal__close-button').click()
-        except NoSuchElementException:
-            print('No close button')
-        self.scroll(browser, 1.5)
-
-        scrapy_selector = Selector(text=browser.page_source)
-        products = scrapy_selector.css('.product')
+        products = response.css('.product')
         for product in products:
             item = ProductItem()
             name = product.css('span.product-name::text').get()
@@ -86,5 +59,3 @@ class ProductSpider(scrapy.Spider):
             product_link = product.css('a.name::attr(href)').get()
             item['product_link'] = product_link
             yield item
-
-        browser.quit()